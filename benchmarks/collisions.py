@@ -0,0 +1,78 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+benchmark of Glyph.get_collisions latency against the number of links on a page
+
+usage: python benchmarks/collisions.py [nlinks ...]
+
+each page holds nlinks linked words.  'index' times get_collisions, which
+hit-tests against the spatial index built by update, 'scan' times a walk over
+every rect in Glyph.links, which is how get_collisions used to work.  both are
+timed over the same set of random points on the page.
+"""
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+
+from glyph import Glyph
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+NLINKS = [100, 1000, 5000, 20000]
+NPOINTS = 2000
+RECT = Rect(0, 0, 1600, 4000)
+
+
+
+def page(nlinks):
+    # accepts a number of links
+    # returns a markup document with nlinks linked words
+    return ' '.join('{link l%d; word%d} and' % (i, i) for i in xrange(nlinks))
+
+
+def scan(glyph, mpos):
+    # get_collisions by walking every link rect
+    links, rect = glyph.links, glyph.rect
+    for link in links:
+        for _rect in links[link]:
+            if _rect.move(rect.topleft).collidepoint(mpos): return link
+
+
+def main(sizes):
+    rnd = random.Random(0)
+    points = [(rnd.randrange(RECT.w), rnd.randrange(RECT.h))
+              for i in xrange(NPOINTS)]
+    print '%8s %8s %12s %12s' % ('links', 'rects', 'index us', 'scan us')
+    for nlinks in sizes:
+        glyph = Glyph(RECT)
+        glyph.input(page(nlinks))
+        nrects = sum(len(v) for v in glyph.links.values())
+
+        get_collisions = glyph.get_collisions
+        t = time.time()
+        for mpos in points: get_collisions(mpos)
+        t_index = (time.time() - t) / NPOINTS
+
+        t = time.time()
+        for mpos in points[:200]: scan(glyph, mpos)
+        t_scan = (time.time() - t) / 200
+
+        print '%8d %8d %12.2f %12.2f' % (nlinks, nrects, t_index * 1e6,
+                                         t_scan * 1e6)
+
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or NLINKS)
@@ -0,0 +1,84 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+benchmark of glyph markup interpretation throughput, in characters per second
+
+usage: python benchmarks/interpret.py [size ...]
+
+each size is the length in characters of a generated markup document.  the
+document mixes plain text, environments, macros, and functions the way the
+example pages do.  'compile' times the lexer and compiler with an empty
+compiled document cache, 'interpret' times Glyph._interpret when the compiled
+document is already cached.
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+
+from glyph import glyph as _glyph
+from glyph import Glyph, Macros
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+PARAGRAPH = """glyph syntax is modeled loosely after the LaTeX environment syntax.
+{red; appropriately}, we will call text manipulation in glyph an 'environment'.
+a left curly bracket, /{, indicates the beginning of an environment.
+/space{10}it can even {color 0, 255, 0; nest these {red; features} for you}.
+click {link here; {bkg 0, 0, 255; here}} to learn more, or //n for a newline
+/n
+"""
+SIZES = [10000, 100000, 1000000]
+REPEAT = 3
+
+
+
+def document(size):
+    # accepts a size in characters
+    # returns a markup document at least size characters long
+    n = size // len(PARAGRAPH) + 1
+    return PARAGRAPH * n
+
+
+def best(f, *a):
+    # accepts a function and its arguments
+    # returns the best wall time of REPEAT calls to f
+    times = []
+    for i in xrange(REPEAT):
+        t = time.time()
+        f(*a)
+        times.append(time.time() - t)
+    return min(times)
+
+
+def compile_cold(txt):
+    _glyph._COMPILED.clear()
+    _glyph._compile(txt)
+
+
+def main(sizes):
+    Macros['red'] = ('color', (255, 0, 0))
+    g = Glyph(Rect(0, 0, 640, 480))
+    print '%10s %16s %16s' % ('chars', 'compile chars/s', 'interpret chars/s')
+    for size in sizes:
+        txt = document(size)
+        t_compile = best(compile_cold, txt)
+        _glyph._compile(txt)
+        t_interpret = best(g._interpret, txt)
+        print '%10d %16d %16d' % (len(txt), len(txt) / t_compile,
+                                  len(txt) / t_interpret)
+
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or SIZES)
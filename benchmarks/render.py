@@ -0,0 +1,118 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+benchmark of the surfaces made to render a page of text, by rendering mode
+
+usage: python benchmarks/render.py [justify ...]
+
+each justify is a justify command a page of text is input with.  'tokens'
+renders each word and copies it to its line, which is how glyph renders by
+default, with no token cache, so every word on the page is rendered.
+'cached' is the same with a token cache that already holds the words of the
+page.  'runs' renders each run of text of one style on a line with one font
+render.  renders counts the font render calls, surfaces counts every surface
+made, font renders included, and pixels counts the pixels of those surfaces.
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect, Surface
+from pygame.font import Font
+
+from glyph import glyph as _glyph
+from glyph import Glyph, LRUCache
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+PARAGRAPH = ("glyph syntax is modeled loosely after the LaTeX environment "
+             "syntax.  {red; appropriately}, we will call text manipulation in "
+             "glyph an 'environment'.  a left curly bracket indicates the "
+             "beginning of an environment.  the first word following the left "
+             "curly bracket declares the environment type./n/n")
+JUSTIFY = ['left', 'justified']
+RECT = Rect(0, 0, 640, 480)
+REPEAT = 3
+
+
+
+class Counts(object):
+    # counts the surfaces made while rendering
+
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.renders = self.surfaces = self.pixels = 0
+
+
+    def add(self, surf):
+        self.surfaces += 1
+        self.pixels += surf.get_width() * surf.get_height()
+        return surf
+
+
+
+class CountingFont(Font):
+    # a font that counts the surfaces it renders
+
+
+    def render(self, *args):
+        COUNTS.renders += 1
+        return COUNTS.add(Font.render(self, *args))
+
+
+
+def counting_surface(*args):
+    return COUNTS.add(Surface(*args))
+
+
+def render(justify, runs, cache):
+    # accepts a justify command, a rendering mode, and a token cache
+    # returns the wall time to input and render a page
+    g = Glyph(RECT, font=FONT, cache=cache, runs=runs)
+    COUNTS.reset() # count the surfaces of the page, not of the glyph
+    t = time.time()
+    g.input(PARAGRAPH * 8, justify)
+    return time.time() - t
+
+
+def warm(justify):
+    # accepts a justify command
+    # returns a token cache holding the tokens of a page
+    cache = LRUCache()
+    render(justify, False, cache)
+    return cache
+
+
+def main(justifies):
+    global COUNTS, FONT
+    COUNTS, FONT = Counts(), CountingFont(None, 16)
+    _glyph.Macros['red'] = ('color', (255, 0, 0))
+    _glyph.Surface = counting_surface
+    print '%10s %8s %8s %8s %10s %8s' % ('justify', 'mode', 'renders',
+                                          'surfaces', 'pixels', 'ms')
+    for justify in justifies:
+        modes = (('tokens', False, None), ('cached', False, warm(justify)),
+                 ('runs', True, None))
+        for mode, runs, cache in modes:
+            times = [render(justify, runs, cache) for i in xrange(REPEAT)]
+            print '%10s %8s %8d %8d %10d %8.2f' % (
+                justify, mode, COUNTS.renders, COUNTS.surfaces, COUNTS.pixels,
+                min(times) * 1000)
+
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or JUSTIFY)
@@ -0,0 +1,240 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+benchmark suite of the Glyph and Editor hot paths, with results written as
+JSON so that releases can be compared
+
+usage: python benchmarks/suite.py [-o results.json] [-c baseline.json]
+                                  [-t threshold] [--quick]
+
+'glyph.input' times Glyph.input laying out a document without drawing it,
+and 'glyph.update' times the update that renders and draws it, by document
+size, justify command, and number of columns.  'glyph.get_collisions' times
+one hit-test by the number of links on the page.  'editor.keystroke' times
+one Editor.input KEYDOWN by the size of the editor text and where the cursor
+types into it, and 'editor.pixel2index' times one Editor._pixel2index by the
+size of the editor text.  every result is the best of several runs, in
+milliseconds for glyph.input and glyph.update and microseconds otherwise.
+
+the results are printed, and written to the -o file.  with -c, each result
+is compared to the same result in a baseline file written by an earlier
+run, and results slower than the baseline by more than the threshold ratio
+(default 1.2) are reported as regressions; the exit status is then the
+number of regressions.  the suite runs under the dummy SDL video driver.
+"""
+
+import json
+import optparse
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+from pygame.event import Event
+from pygame.locals import KEYDOWN, K_a
+
+from glyph import Editor, Glyph, Macros
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+PARAGRAPH = ("glyph syntax is modeled loosely after the LaTeX environment "
+             "syntax.  {red; appropriately}, we will call text manipulation in "
+             "glyph an 'environment'.  a left curly bracket indicates the "
+             "beginning of an {link env; environment}.  the first word "
+             "following the left curly bracket declares the environment "
+             "type./n/n")
+WORDS = ("the quick brown fox jumps over the lazy dog while glyph lays out "
+         "and draws the text of an editor one keystroke at a time ").split()
+# (sizes, justify commands, column counts, link counts, editor sizes) of a
+# full run and of a quick run
+FULL = ([1000, 10000, 50000], [None, 'justified', 'center'], [1, 2],
+        [100, 1000, 10000], [100, 1000, 10000])
+QUICK = ([1000, 10000], [None, 'justified'], [1, 2], [100, 1000],
+         [100, 1000])
+GLYPH_RECT = Rect(0, 0, 640, 480)
+EDITOR_RECT = Rect(0, 0, 400, 300)
+REPEAT = 3
+NKEYS = 100 # keystrokes timed per run
+NPOINTS = 1000 # points hit-tested per run
+THRESHOLD = 1.2
+
+
+
+def best(setup, run, repeat=REPEAT):
+    # accepts a function returning the argument of run, and the function
+    #   timed
+    # returns the best wall time of repeat calls to run, each with a new
+    #   argument from setup
+    times = []
+    for i in xrange(repeat):
+        arg = setup()
+        t = time.time()
+        run(arg)
+        times.append(time.time() - t)
+    return min(times)
+
+
+def key(bench, **params):
+    # accepts the name of a benchmark and its parameters
+    # returns the name of the result, e.g. 'glyph.input[chars=1000,ncols=1]'
+    return '%s[%s]' % (bench, ','.join('%s=%s' % (k, params[k])
+                                       for k in sorted(params)))
+
+
+def document(size):
+    # accepts a size in characters
+    # returns a markup document at least size characters long
+    return PARAGRAPH * (size // len(PARAGRAPH) + 1)
+
+
+def editor_text(size):
+    # accepts a size in characters
+    # returns plain text of size characters, with a newline every few lines
+    rnd, words, n = random.Random(0), [], 0
+    while n < size:
+        word = rnd.choice(WORDS)
+        if rnd.random() < 0.02: word += '\n'
+        words.append(word)
+        n += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def glyph_rect(size):
+    # accepts a document size
+    # returns a rect tall enough to hold the document in any number of
+    #   columns, so that no text is left in the buffer
+    return Rect(0, 0, GLYPH_RECT.w, max(GLYPH_RECT.h, size // 6))
+
+
+def bench_glyph(results, sizes, justifies, ncols_list):
+    for size in sizes:
+        txt = document(size)
+        for justify in justifies:
+            for ncols in ncols_list:
+                rect = glyph_rect(size)
+                def setup():
+                    return Glyph(rect, ncols=ncols, cache=None)
+                def run(glyph): glyph.input(txt, justify, update=False)
+                def setup_update():
+                    glyph = setup()
+                    glyph.input(txt, justify, update=False)
+                    return glyph
+                def run_update(glyph): glyph.update()
+                params = dict(chars=size, justify=justify, ncols=ncols)
+                results[key('glyph.input', **params)] = \
+                    best(setup, run) * 1e3
+                results[key('glyph.update', **params)] = \
+                    best(setup_update, run_update) * 1e3
+
+
+def bench_collisions(results, nlinks_list):
+    rect = Rect(0, 0, 1600, 4000)
+    rnd = random.Random(0)
+    points = [(rnd.randrange(rect.w), rnd.randrange(rect.h))
+              for i in xrange(NPOINTS)]
+    for nlinks in nlinks_list:
+        glyph = Glyph(rect)
+        glyph.input(' '.join('{link l%d; word%d} and' % (i, i)
+                             for i in xrange(nlinks)))
+        def run(get_collisions):
+            for mpos in points: get_collisions(mpos)
+        results[key('glyph.get_collisions', links=nlinks)] = \
+            best(lambda: glyph.get_collisions, run) / NPOINTS * 1e6
+
+
+def bench_editor(results, sizes):
+    events = [Event(KEYDOWN, key=K_a, unicode=u'a', mod=0)] * NKEYS
+    for size in sizes:
+        txt = editor_text(size)
+        for cursor in ('top', 'middle', 'end'):
+            def setup():
+                editor = Editor(Rect(EDITOR_RECT))
+                editor.insert_text(txt)
+                editor._cursor = {'top': 0, 'middle': size // 2,
+                                  'end': size}[cursor]
+                return editor
+            def run(editor):
+                for event in events: editor.input(event)
+            results[key('editor.keystroke', chars=size, cursor=cursor)] = \
+                best(setup, run) / NKEYS * 1e6
+
+        editor = Editor(Rect(EDITOR_RECT))
+        editor.insert_text(txt)
+        bottom = editor._lines[-1].rect.bottom
+        rnd = random.Random(0)
+        points = [(rnd.randrange(EDITOR_RECT.w), rnd.randrange(bottom))
+                  for i in xrange(NPOINTS)]
+        def run(pixel2index):
+            for pixel in points: pixel2index(pixel)
+        results[key('editor.pixel2index', chars=size)] = \
+            best(lambda: editor._pixel2index, run) / NPOINTS * 1e6
+
+
+def compare(results, baseline, threshold):
+    # accepts the results of this run, the results of a baseline run, and
+    #   the ratio of result to baseline a result regresses at
+    # returns the number of regressed results
+    regressions = 0
+    print
+    print '%-58s %10s %10s %7s' % ('compared to baseline', 'baseline', 'now',
+                                    'ratio')
+    for name in sorted(results):
+        if name not in baseline: continue
+        ratio = results[name] / baseline[name]
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = ' REGRESSION'
+        print '%-58s %10.2f %10.2f %7.2f%s' % (name, baseline[name],
+                                               results[name], ratio, flag)
+    return regressions
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', help='write the results to a file')
+    parser.add_option('-c', '--compare', help='compare to a baseline file')
+    parser.add_option('-t', '--threshold', type='float', default=THRESHOLD,
+                      help='ratio to the baseline a result regresses at')
+    parser.add_option('--quick', action='store_true',
+                      help='run fewer, smaller cases')
+    options, args = parser.parse_args(argv)
+
+    sizes, justifies, ncols_list, nlinks_list, editor_sizes = (
+        QUICK if options.quick else FULL)
+    Macros['red'] = ('color', (255, 0, 0))
+    results = {}
+    bench_glyph(results, sizes, justifies, ncols_list)
+    bench_collisions(results, nlinks_list)
+    bench_editor(results, editor_sizes)
+
+    for name in sorted(results): print '%-58s %10.2f' % (name, results[name])
+    report = {'meta': {'python': platform.python_version(),
+                       'pygame': pygame.version.ver,
+                       'platform': platform.platform(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'quick': bool(options.quick)},
+              'results': results}
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f: baseline = json.load(f)['results']
+        return compare(results, baseline, options.threshold)
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
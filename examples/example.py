@@ -233,9 +233,9 @@ the following are the functions supported by the glyph minilanguage
 /space{20}will be colored to match the current environment
 /n
 /space{10}//img/{loc/}
+/space{10}//img/{loc, width, height/}
 /space{20}loc is the loation of the image file.  any image format supported by pygame's image library can be
-/space{20}loaded.
-/space{20}FUTURE: a rescale argument that will be used to rescale the image to the given dimensions.
+/space{20}loaded.  width and height, if given, are the dimensions the image will be rescaled to.
 /n
 just as with environments, functions may be called from entries in the glyph.Macro dictionary.  insert the macro name, and then the item that the function would normally return.  for example:
 /n
@@ -303,6 +303,8 @@ class Main():
         glyph.update()
         SCREEN.blit(BKGSCREEN, (0, 0))
         SCREEN.blit(glyph.image, glyph_rect)
+        display.update()
+        glyph.get_dirty()
         while 1:
             link = glyph.get_collisions(mouse.get_pos())
             if link: mouse.set_cursor(*HAND_CURSOR)
@@ -331,8 +333,12 @@ class Main():
                 editor.image.fill((255, 205, 0), cursor)
                 glyph.update()
 
-            SCREEN.blit(glyph.image, glyph_rect)
-            display.update()
+            # draw only the areas of the glyph that changed
+            dirty = glyph.get_dirty()
+            for rect in dirty:
+                SCREEN.blit(glyph.image, rect,
+                            rect.move(-glyph_rect.x, -glyph_rect.y))
+            display.update(dirty)
 
 
     def start_editor(self):
@@ -345,6 +351,7 @@ class Main():
         SCREEN.blit(EDITOR_BKGSCREEN, (0, 0))
         SCREEN.blit(glyph.image, glyph_rect)
         SCREEN.blit(editor.image, editor_rect)
+        display.update()
         editor_focus = False
         while 1:
             mouse_pos = mouse.get_pos()
@@ -367,7 +374,7 @@ class Main():
             editor.image.fill((255, 205, 0), cursor)
 
             SCREEN.blit(editor.image, editor_rect)
-            display.update()
+            display.update(editor_rect)
 
 
 
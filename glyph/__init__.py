@@ -84,8 +84,10 @@ the following are the functions supported by the glyph minilanguage
     spacesize is the size of the space in pixels.  this will insert blank space within the text.  the space will be colored to match the current environment
 
   /img{loc}
+  /img{loc, width, height}
     loc is the loation of the image file.  any image format supported by pygame's image library can be loaded.
-    FUTURE: a rescale argument that will be used to rescale the image to the given dimensions.
+    width and height, if given, are the dimensions the image will be rescaled to.
+    images are loaded once and kept in the glyph.Images cache, along with their rescaled versions.  call glyph.Images.invalidate(loc) after changing an image file to have it reloaded.
 
 just as with environments, functions may be called from entries in the glyph.Macro dictionary.  insert the macro name, and then the item that the function would normally return.  for example:
 
@@ -106,5 +108,10 @@ see the example folder, provided with the source distribution, for an example sc
 
 
 
-from .glyph import Glyph, GlyphGroup, Macros
+from .cache import FontPool, ImageCache, LRUCache
+from .glyph import (Atlases, Fonts, Glyph, GlyphGroup, Images, Macros,
+                    Paginator, Tokens)
 from .editor import Editor, EditorGroup
+from .batch import render_many
+from .pages import PageCache
+from .stats import Stats
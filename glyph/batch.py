@@ -0,0 +1,178 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+
+
+
+import mmap
+import multiprocessing
+from multiprocessing import Pool, cpu_count
+import os
+
+from pygame import Rect
+from pygame.image import frombuffer, tostring
+
+from .editor import Editor
+from .glyph import Fonts, Glyph, Macros
+
+
+
+
+######################################################################
+# globals
+# the (rect, justify, kwargs, buffer) of the batch being rendered.  worker
+# processes are forked after it is set, so they inherit it along with the
+# fonts, macros, and images of the parent, none of which can be pickled
+_BATCH = None
+
+
+
+
+######################################################################
+# private functions
+def _forks():
+    # determine if worker processes are forked, so that they inherit the
+    # batch.  workers started otherwise, e.g. spawned on Windows or on macOS
+    # under Python 3, import this module afresh and find no batch
+    # accepts nothing
+    # returns true if workers are forked, else false
+    if not hasattr(os, 'fork'): return False
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    return get_start_method is None or get_start_method() == 'fork'
+
+
+
+def _init_worker():
+    # set up a worker process.  workers draw nothing to the display, so a
+    # worker that starts a display of its own, e.g. to convert an image,
+    # starts one without a window
+    # accepts nothing
+    # returns nothing
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+
+
+def _font_ref(font, glyph_font):
+    # get a reference to a font that the calling process can resolve to the
+    # font, since fonts can not be passed between processes
+    # accepts a font and the font of the glyph it is used by
+    # returns None for the font of the glyph, ('macro', name) for a font set
+    #   by a macro, ('pool', key) for a font opened by a font environment, or
+    #   False if the font can not be referred to
+    if font is glyph_font: return None
+    for name, value in Macros.items():
+        if (isinstance(value, tuple) and len(value) == 2
+            and value[0] == 'font' and value[1] is font):
+            return ('macro', name)
+    for key, value in Fonts._entries.items():
+        if value is font: return ('pool', key)
+    return False
+
+
+
+def _font(ref, glyph_font):
+    # get the font a reference from _font_ref refers to
+    # accepts a font reference and the font of the glyph it is used by
+    # returns a Font object
+    if ref is None: return glyph_font
+    kind, key = ref
+    if kind == 'macro': return Macros[key][1]
+    return Fonts.load(*key)
+
+
+
+def _render(task):
+    # lay out and render a document, and write its pixels to the shared
+    # buffer of the batch
+    # accepts an (i, txt) pair, where i is the index of the document txt in
+    #   the batch
+    # returns an (i, links, editors) tuple, where links is a dictionary of
+    #   link id strings keyed to lists of link rects, as (x, y, w, h) tuples,
+    #   and editors is a list of the (name, rect, text, bkg, color, font
+    #   reference) of the editors whose fonts can be referred to, as for
+    #   _font_ref
+    i, txt = task
+    rect, justify, kwargs, buff = _BATCH
+    glyph = Glyph(Rect(rect), **kwargs)
+    glyph.input(txt, justify)
+    n = rect.w * rect.h * 4
+    buff[i * n:(i + 1) * n] = tostring(glyph.image, 'RGBX')
+    links = dict((link, [tuple(r) for r in rects])
+                 for link, rects in glyph.links.items())
+    glyph_font = dict(glyph._envs)['font']
+    editors = []
+    for name, editor in glyph.editors.items():
+        ref = _font_ref(editor.font, glyph_font)
+        if ref is False: continue
+        editors.append((name, tuple(editor.rect), editor.get_text(),
+                        tuple(editor.bkg), tuple(editor.color), ref))
+    return i, links, editors
+
+
+
+
+######################################################################
+# public functions
+def render_many(docs, rect, justify=None, workers=None, **kwargs):
+    """
+    lay out and render many documents at once, in a pool of worker processes.
+    each worker writes the pixels of the documents it renders to memory
+    shared with the calling process, and the returned glyphs draw from that
+    memory without copying it.  worker processes are forked, so fonts, macros,
+    and images set up before the call can be used by the documents
+
+    docs-- a sequence of markup documents
+    rect-- rect object for positioning the glyph images on viewing surface
+    justify-- a justify command, as for the Glyph input method
+    workers-- the number of worker processes; default is the number of
+      cores.  1 renders the documents in the calling process, as do
+      platforms that can not fork worker processes, because fonts, macros,
+      and images can not be passed to workers that are not forked
+    **kwargs-- keyword arguments the glyphs are initialized with, as for Glyph
+
+    returns a list of Glyph objects, one for each document, with the image,
+    links, and editors of the rendered document.  the glyphs are ready to
+    draw, but hold the image and not the text, so methods that lay out text
+    raise ValueError until a glyph is cleared, as for PageCache.  editors are
+    kept if their font is the font of the glyph, or is set by a macro or a
+    font environment; editors in other fonts are drawn and not kept
+    """
+    global _BATCH
+    docs = list(docs)
+    if workers is None: workers = cpu_count()
+    n = rect.w * rect.h * 4
+    buff = mmap.mmap(-1, max(n * len(docs), 1))
+
+    _BATCH = (Rect(rect), justify, kwargs, buff)
+    try:
+        if workers == 1 or len(docs) < 2 or not _forks():
+            results = map(_render, enumerate(docs))
+        else:
+            pool = Pool(min(workers, len(docs)), _init_worker)
+            try: results = pool.map(_render, enumerate(docs))
+            finally:
+                pool.close()
+                pool.join()
+    finally: _BATCH = None
+
+    glyphs = []
+    for i, links, editors in results:
+        glyph = Glyph(Rect(rect), **kwargs)
+        image = frombuffer(buffer(buff, i * n, n), rect.size, 'RGBX')
+        image.set_alpha(255)
+        glyph.image = image
+        glyph._loaded = True
+        glyph._dirty = [image.get_rect()]
+        for link, rects in links.items():
+            glyph.links[link] = [Rect(r) for r in rects]
+        glyph._index.add(glyph.links)
+
+        glyph_font = dict(glyph._envs)['font']
+        for name, _rect, txt, bkg, color, ref in editors:
+            editor = Editor(Rect(_rect), bkg=bkg, color=color,
+                            font=_font(ref, glyph_font),
+                            spacing=glyph.spacing)
+            editor.insert_text(txt)
+            glyph.editors[name] = editor
+        glyphs.append(glyph)
+    return glyphs
@@ -0,0 +1,205 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+
+
+
+from collections import OrderedDict
+import os
+from threading import Lock
+
+import pygame
+from pygame.font import Font
+from pygame.transform import scale
+
+
+
+
+######################################################################
+# private functions
+def _nbytes(surf):
+    # accepts a surface
+    # returns the number of bytes of pixel data held by the surface
+    return surf.get_pitch() * surf.get_height()
+
+
+
+
+######################################################################
+# public classes
+class LRUCache(object):
+    """
+    a bounded mapping that discards the least recently used entry when full.
+    caches may be shared between threads, as they are when glyphs lay out
+    text with input_async
+
+    maxsize-- the maximum number of entries held by the cache
+    hits-- the number of get calls that found a cached entry
+    misses-- the number of get calls that did not find a cached entry
+    """
+
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock() # held while _entries is read or changed
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+    def get(self, key, default=None):
+        """
+        get the value cached at key and mark it as most recently used
+
+        returns the cached value, or default if key is not cached
+        """
+        entries = self._entries
+        with self._lock:
+            try: value = entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            entries[key] = value
+            self.hits += 1
+        return value
+
+
+    def put(self, key, value):
+        """
+        cache value at key, discarding least recently used entries if the
+        cache is full
+
+        returns value
+        """
+        entries = self._entries
+        with self._lock:
+            if key in entries: del entries[key]
+            entries[key] = value
+            while len(entries) > self.maxsize: entries.popitem(last=False)
+        return value
+
+
+    def clear(self):
+        """discard every entry in the cache and reset the hit and miss counts"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+
+class FontPool(LRUCache):
+    """
+    an LRUCache of fonts keyed by resolved font file path and size, so that
+    each font file is opened once no matter how often it is used
+
+    maxsize-- the maximum number of fonts held open by the pool
+    """
+
+
+    def __init__(self, maxsize=32):
+        LRUCache.__init__(self, maxsize)
+
+
+    def load(self, path, size):
+        """
+        get a font from the pool, opening it if it is not pooled
+
+        path-- path to the font file
+        size-- size of the font
+
+        returns a Font object
+        """
+        key = (os.path.realpath(path), size)
+        font = self.get(key)
+        if font is None: font = self.put(key, Font(*key))
+        return font
+
+
+
+class ImageCache(LRUCache):
+    """
+    an LRUCache of images keyed by resolved image file path and size.  an
+    image rescaled to a size is computed from the cached original, and is
+    cached itself
+
+    maxsize-- the maximum number of images held by the cache
+    maxbytes-- the maximum number of bytes of pixel data held by the cache
+    nbytes-- the number of bytes of pixel data currently held by the cache
+    """
+
+
+    def __init__(self, maxsize=256, maxbytes=32*1024*1024):
+        LRUCache.__init__(self, maxsize)
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+
+
+    def load(self, path, size=None):
+        """
+        get an image from the cache, loading it if it is not cached
+
+        path-- path to the image file
+        size-- (width, height) to rescale the image to; default is the size of
+          the image file
+
+        returns a Surface object
+        """
+        key = (os.path.realpath(path), size)
+        image = self.get(key)
+        if image is None:
+            if size is None: image = pygame.image.load(key[0]).convert()
+            else: image = scale(self.load(path), size)
+            self.put(key, image)
+        return image
+
+
+    def put(self, key, image):
+        """
+        cache image at key, discarding least recently used images if the
+        cache is full or over its byte budget
+
+        returns image
+        """
+        entries = self._entries
+        with self._lock:
+            if key in entries: self.nbytes -= _nbytes(entries.pop(key))
+            entries[key] = image
+            self.nbytes += _nbytes(image)
+            while entries and (len(entries) > self.maxsize
+                               or self.nbytes > self.maxbytes):
+                self.nbytes -= _nbytes(entries.popitem(last=False)[1])
+        return image
+
+
+    def invalidate(self, path=None):
+        """
+        discard an image and its rescaled variants, so that they are reloaded
+        from file the next time they are used
+
+        path-- path to the image file; default discards every image
+        """
+        entries = self._entries
+        with self._lock:
+            if path is None:
+                entries.clear()
+                self.nbytes = 0
+                return
+            path = os.path.realpath(path)
+            for key in [key for key in entries if key[0] == path]:
+                self.nbytes -= _nbytes(entries.pop(key))
+
+
+    def clear(self):
+        """discard every image in the cache and reset the hit and miss counts"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self.nbytes = 0
@@ -3,13 +3,12 @@
 
 
 
-from collections import deque
+from bisect import bisect_right
 from pygame import Rect, Surface
 from pygame import font
 from pygame.font import Font
 from pygame.sprite import Sprite
 from pygame.locals import *
-import re
 
 
 
@@ -25,6 +24,8 @@ DIRECTION_KEYS = [K_UP, K_DOWN, K_LEFT, K_RIGHT]
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 FONT = Font(None, 8)
+SPACES = frozenset(' \t\n\r\f\v') # the characters glyph treats as whitespace
+GAP = 64 # the least number of bytes a gap buffer grows its gap by
 
 
 
@@ -35,21 +36,152 @@ def _iswhitespace(char):
     # accepts a char, if char is not a string then it is always
     # considered whitespace
     # returns true if char is whitespace, else returns false
-    whitespace = re.compile('\s+') # re to detect whitespace
-    if isinstance(char, str):
-        assert len(char) == 1
-        if whitespace.search(char): return True
-        return False
+    if isinstance(char, str): return char in SPACES
     return False
 
 
 
+def _join_edits(edit, i, j, d):
+    # join an edit of the text to the edits made since the text was laid out
+    # accepts edit: (i, j, d) of the edits since the last layout, or None
+    # i: the index of the first edited character
+    # j: the index of the first character after the edited text
+    # d: the number of characters the text after j moved by
+    # returns (i, j, d), where the text from i to j holds every edit, and
+    #   the text after j moved by d
+    if edit is None: return i, j, d
+    _i, _j, _d = edit
+    if _j < i: return _i, j, _d + d
+    return min(_i, i), max(j, _j + d), _d + d
+
+
+
+class _GapBuffer(object):
+    # the text of an editor, stored in a bytearray with a gap at the position
+    # of the last edit, so that typing at the cursor moves none of the text
+    # after it.  reading the text is the same as reading a list of single
+    # characters: indexing returns a character, and slicing returns a string
+    # buff is the bytearray of the text and the gap
+    # start and end are the bounds of the gap in buff
+
+
+    def __init__(self, txt=''):
+        self.buff = bytearray(txt) + bytearray(GAP)
+        self.start = len(txt)
+        self.end = len(self.buff)
+
+
+    def __len__(self):
+        return len(self.buff) - (self.end - self.start)
+
+
+    def __iter__(self):
+        return iter(self.get_text())
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            a, b, step = i.indices(len(self))
+            if step != 1: return self.get_text()[i]
+            if b < a: b = a
+            buff, start, end = self.buff, self.start, self.end
+            if b <= start: return str(buff[a:b])
+            gap = end - start
+            if a >= start: return str(buff[a + gap:b + gap])
+            return str(buff[a:start]) + str(buff[end:b + gap])
+
+        n = len(self)
+        if i < 0: i += n
+        if not 0 <= i < n: raise IndexError('text index out of range')
+        if i >= self.start: i += self.end - self.start
+        return chr(self.buff[i])
+
+
+    def _move(self, i):
+        # moves the gap to i
+        buff, start, end = self.buff, self.start, self.end
+        if i < start: buff[end - (start - i):end] = buff[i:start]
+        elif i > start: buff[start:i] = buff[end:end + (i - start)]
+        self.start, self.end = i, end + (i - start)
+
+
+    def insert(self, i, txt):
+        # inserts the string txt before index i
+        n = len(txt)
+        self._move(i)
+        if self.end - self.start < n:
+            # grow the gap, at least doubling the buffer
+            grow = max(n, len(self.buff), GAP)
+            self.buff[self.start:self.start] = bytearray(grow)
+            self.end += grow
+        self.buff[self.start:self.start + n] = txt
+        self.start += n
+
+
+    def delete(self, i, j):
+        # deletes the characters from index i to j
+        self._move(i)
+        self.end += j - i
+
+
+    def pop(self, i):
+        # deletes the character at index i
+        # returns the character
+        char = self[i]
+        self.delete(i, i + 1)
+        return char
+
+
+    def get_text(self):
+        return str(self.buff[:self.start]) + str(self.buff[self.end:])
+
+
+
+class _Widths(object):
+    # the widths of the prefixes of the text of a line, read as a list where
+    # the jth item is the width of the first j characters.  a prefix is
+    # measured when it is first read, so that bisecting the widths measures
+    # as few prefixes as it reads.  prefixes are measured whole, rather than
+    # summed from character advances, because characters drawn past their
+    # advance make a prefix wider than the sum
+    # txt is the text of the line
+    # size is the size method of the font of the line
+    # widths is a dictionary of the measured widths keyed to prefix length
+
+
+    def __init__(self, txt, size):
+        self.txt = txt
+        self.size = size
+        self.widths = {0: 0}
+
+
+    def __len__(self):
+        return len(self.txt) + 1
+
+
+    def __getitem__(self, j):
+        if j < 0: j += len(self)
+        if not 0 <= j <= len(self.txt): raise IndexError('prefix out of range')
+        widths = self.widths
+        try: return widths[j]
+        except KeyError:
+            w = widths[j] = self.size(self.txt[:j])[0]
+            return w
+
+
+
 class _Line(object):
+    # widths is the _Widths of the prefixes of the text of the line, or None
+    #   until they are read
+    # wrapped is true if the line starts where the line before it wrapped,
+    #   rather than after a newline
 
 
-    def __init__(self, image, rect):
+    def __init__(self, image, rect, wrapped=False):
         self.image = image
         self.rect = rect
+        self.widths = None
+        self.wrapped = wrapped
 
 
     def clear(self, surface_dest, background):
@@ -79,6 +211,11 @@ class EditorGroup(dict):
 
 
 class Editor(object):
+    """
+    a text editor, drawn to its image as text is input with KEYDOWN events
+    txt-- the text of the editor, read as a list of single characters.  the
+      last character is a space the cursor rests on at the end of the text
+    """
 
 
     def __init__(self, rect, txt=None,
@@ -86,8 +223,8 @@ class Editor(object):
         self.image = Surface(rect.size)
         self._image = Surface(rect.size)
         self.rect = rect
-        if txt is None: self.txt = [' ']
-        else: self.txt = txt
+        if txt is None: txt = ' '
+        self.txt = _GapBuffer(''.join(txt))
         self._lines = [_Line(Surface((0, 0)), Rect(0, 0, 0, 0))]
         self._wraps = [0]
         self._cursor = 0
@@ -112,62 +249,81 @@ class Editor(object):
         """clear the editor image of all lines and reset the cursor"""
         lines = self._lines
         image, bkg_image = self.image, self._image
-        for line in lines: line.clear(image, bkg_img)
+        for line in lines: line.clear(image, bkg_image)
         self._cursor = 0
 
 
+    def get_text(self):
+        """
+        get the text of the editor
+
+        returns the text as a string, without the space at its end
+        """
+        return self.txt[:-1]
+
+
     def _index2line(self, i):
-        wraps = self._wraps
+        return bisect_right(self._wraps, i) - 1
 
-        for l, wrap in enumerate(wraps):
-            if wrap > i: return l - 1
 
-        return len(wraps) - 1
+    def _get_widths(self, l):
+        # get the widths of the prefixes of the text of a line.  the widths
+        # are measured as they are read, and kept until the line is changed
+        # accepts the index of the line
+        # returns a _Widths object, read as a list where the jth item is the
+        #   width of the first j characters of the line
+        line = self._lines[l]
+        if line.widths is None:
+            txt, wraps = self.txt, self._wraps
+            if l == len(wraps) - 1: n = len(txt)
+            else: n = wraps[l + 1]
+            line.widths = _Widths(txt[wraps[l]:n], self.font.size)
+        return line.widths
 
 
     def _index2pixel(self, i):
-        font, lines, txt = self.font, self._lines, self.txt
-        wraps = self._wraps + [len(txt)]
-        index2line = self._index2line
+        l = self._index2line(i)
 
-        l = index2line(i)
-
-        x = font.size(''.join(txt[wraps[l]:i]))[0]
-        y = lines[l].rect.y
+        x = self._get_widths(l)[i - self._wraps[l]]
+        y = self._lines[l].rect.y
 
         return x, y
 
 
     def _pixel2index(self, pixel):
-        font, txt, wraps = self.font, self.txt, self._wraps
-        pixel2line = self._pixel2line
+        txt, wraps = self.txt, self._wraps
 
-        l = pixel2line(pixel)
+        l = self._pixel2line(pixel)
         if l == len(wraps) - 1: m, n = wraps[l], len(txt)
 
         else: m, n = wraps[l:l + 2]
+        if n <= m: return m
 
+        # find the first index whose prefix is wider than pixel, then pick it
+        # or the index before it, whichever is nearer to pixel
+        widths = self._get_widths(l)
         pixel_x = pixel[0]
-        d = deque([0, 0], 2)
-        for i in xrange(m, n):
-            font_size_x = font.size(''.join(txt[m:i]))[0]
-            d.append(font_size_x)
-            if font_size_x > pixel_x: break
-
-        l = [abs(font_size_x - pixel_x) for font_size_x in d]
+        j = bisect_right(widths, pixel_x, 0, n - m)
+        if j == n - m: j -= 1 # no prefix of the line is wider than pixel
+        if j: a = widths[j - 1]
+        else: a = 0
+        b = widths[j]
 
-        if l.index(min(l)) == 1: return i
+        if abs(b - pixel_x) < abs(a - pixel_x) or not j: return m + j
 
-        return i - 1
+        return m + j - 1
 
 
     def _pixel2line(self, pixel):
-        lines = self._lines
-
-        for l, line in enumerate(lines):
-            if line.rect.y > pixel[1]: return l - 1
+        # bisect the lines for the last line starting at or above pixel
+        lines, y = self._lines, pixel[1]
+        lo, hi = 0, len(lines)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if lines[mid].rect.y > y: hi = mid
+            else: lo = mid + 1
 
-        return l
+        return lo - 1
 
 
     def _draw_line(self, l):
@@ -191,22 +347,40 @@ class Editor(object):
 
         return None
         """
-        k, font, lines = self._cursor, self.font, self._lines
-        rect_w, txt, wraps = self.rect.w, self.txt, self._wraps
-        image, bkg_img = self.image, self._image
+        self.input_many([event])
+
+
+    def input_many(self, events):
+        """
+        accept a sequence of user KEYDOWN events, and add the text associated
+        with the keypresses to the editor image.  the text is laid out and
+        drawn once for each run of keypresses that edit the text, rather
+        than once per keypress
+
+        events-- a sequence of user KEYDOWN events
+
+        return None
+        """
+        lines, txt = self._lines, self.txt
         draw_line, index2line = self._draw_line, self._index2line
         pixel2index, update = self._pixel2index, self._update
-        Line = _Line
 
-        if event.type == KEYDOWN:
-            l = index2line(k)
+        edit = None # the edits not yet laid out
+        for event in events:
+            if event.type != KEYDOWN: continue
+            k = self._cursor
 
             # handle cursor navigation
             if event.key in DIRECTION_KEYS:
+                if edit:
+                    update(*edit)
+                    edit = None
+                lines, wraps = self._lines, self._wraps
+                l = index2line(k)
                 draw_line(l) #to clear the cursor?
                 if event.key == K_UP:
                     if l > 0:
-                        pixel = (font.size(''.join(txt[wraps[l]:k]))[0],
+                        pixel = (self._get_widths(l)[k - wraps[l]],
                                  lines[l - 1].rect.y)
                         self._cursor = pixel2index(pixel)
 
@@ -214,7 +388,7 @@ class Editor(object):
 
                 elif event.key == K_DOWN:
                     if (len(wraps) - 1) > l:
-                        pixel = (font.size(''.join(txt[wraps[l]:k]))[0],
+                        pixel = (self._get_widths(l)[k - wraps[l]],
                                  lines[l + 1].rect.y)
                         self._cursor = pixel2index(pixel)
 
@@ -233,32 +407,45 @@ class Editor(object):
             elif event.key == K_RETURN:
                 txt.insert(k, '\n')
                 self._cursor += 1
-                lines.insert(l + 1, Line(Surface((0, 0)), Rect(0, 0, 0, 0)))
-                update(l)
+                edit = _join_edits(edit, k, k + 1, 1)
 
             # handle backspaces
             elif event.key == K_BACKSPACE:
                 if k == 0: pass
 
                 else:
-                    lines[l].clear(image, bkg_img)
                     self._cursor -= 1
                     k = self._cursor
                     char = txt.pop(k)
-                    # if l> index2line(k) then the line no longer exists
-                    if l > index2line(k): del lines[l]
-                    if l == 0: update(l)
-                    else: update(l - 1)
+                    edit = _join_edits(edit, k, k, -1)
 
             # handle ascii input
             else:
                 if event.unicode:
-                    txt.insert(k, event.unicode.encode("ascii"))
+                    char = event.unicode.encode("ascii")
+                    txt.insert(k, char)
                     self._cursor += 1
-                    if k == wraps[l]: # wrapped to a new line
-                        if l == 0: update(l) # update line
-                        else: update(l - 1)  # else: update from previous line
-                    else: update(l)
+                    edit = _join_edits(edit, k, k + len(char), len(char))
+
+        if edit: update(*edit)
+
+
+    def insert_text(self, txt, at=None):
+        """
+        insert text into the editor, and lay out and draw it once
+
+        txt-- the text to insert
+        at-- the index in the text of the editor to insert txt at; default is
+          the cursor.  the cursor moves past txt if it is at or after at
+
+        return None
+        """
+        if isinstance(txt, unicode): txt = txt.encode("ascii")
+        k = self._cursor
+        if at is None: at = k
+        self.txt.insert(at, txt)
+        if k >= at: self._cursor = k + len(txt)
+        self._update(at, at + len(txt), len(txt))
 
 
     ##################################################################
@@ -275,54 +462,91 @@ class Editor(object):
         if charbuff: yield ''.join(charbuff)
 
 
-    def _update(self, l):
+    def _update(self, i, end=None, d=0):
+        # lays out the text from the first line an edit can change, and draws
+        # the lines that change.  once a line starts where an old line
+        # started, after the edited text, the lines from there on are the
+        # same as the old lines, so layout stops and the old lines are kept,
+        # moved to their new y
+        # accepts i: the index of the first edited character
+        # end: the index of the first character after the edited text, or
+        #   None to lay out every line from the one i is on
+        # d: the number of characters the text after end moved by
+        # returns nothing
         bkg, color, font = self.bkg, self.color, self.font
         spacing, dest, rect_w = self.spacing, self._dest, self.rect.w
         bkg_img, image = self._image, self.image
-        lines, txt, wraps = self._lines, self.txt, self._wraps
-        tokenize = self._tokenize
+        old_lines, txt, old_wraps = self._lines, self.txt, self._wraps
+        render, size = font.render, font.size
         Line = _Line
 
-        tokens = tokenize(txt[wraps[l]:])
-        dest.y = sum(line.image.get_height() + spacing for line in lines[:l])
-        wraps = wraps[:l + 1]
+        # the edit can change the token it is in, which can change where the
+        # line before wraps, so lay out from that line
+        while i and not _iswhitespace(txt[i - 1]): i -= 1
+        l = bisect_right(old_wraps, i) - 1
+        if old_lines[l].wrapped and i == old_wraps[l]: l -= 1
+        tokens = self._tokenize(txt[old_wraps[l]:])
+        if l: dest.y = old_lines[l - 1].rect.bottom + spacing
+        else: dest.y = 0
+        lines, wraps = old_lines[:l], old_wraps[:l + 1]
         k = wraps[-1]
-        linebuff = []
-        L = [l] # a list of updated lines
+        linebuff = ''
+        # a line that starts where the line before it wrapped takes its first
+        # token whether it fits or not
+        wrapped = fit = old_lines[l].wrapped
+        o, n = l + 1, len(old_wraps) # the next old line layout may stop at
         for token in tokens:
             if token == '\n':
                 k += 1 # increment k (so the \n will be on this line)
                 wraps.append(k)
                 # a space is the visual representation of the \n character
-                linebuff.append(' ')
-                _linebuff = []
+                linebuff += ' '
+                _linebuff, _wrapped = '', False
 
-            elif font.size(''.join(linebuff + [token]))[0] < rect_w:
+            elif fit or size(linebuff + token)[0] < rect_w:
                 k += len(token)
-                linebuff.append(token)
+                linebuff += token
+                fit = False
                 continue
 
             else:
                 wraps.append(k) # k is the position of the previous space token
                 k += len(token)
-                _linebuff = [token]
-                lines.insert(l + 1, Line(Surface((0, 0)), Rect(0, 0, 0, 0)))
-
-            line = font.render(''.join(linebuff), 0, color, bkg)
-            line = Line(line, Rect(dest.topleft, line.get_size()))
-            lines[l].clear(image, bkg_img)
-            lines[l] = line
-
-            dest.y += line.image.get_height() + spacing
-            linebuff = _linebuff
-            l += 1
-            L.append(l)
-
-        line = font.render(''.join(linebuff), 0, color, bkg)
-        line = Line(line, Rect(dest.topleft, line.get_size()))
-        lines[l].clear(image, bkg_img)
-        lines[l] = line
-
-        for line in [lines[l] for l in L]: image.blit(line.image, line.rect)
-
+                _linebuff, _wrapped = token, True
+
+            line = render(linebuff, 0, color, bkg)
+            lines.append(Line(line, Rect(dest.topleft, line.get_size()),
+                              wrapped))
+            dest.y += line.get_height() + spacing
+            linebuff, wrapped, fit = _linebuff, _wrapped, False
+
+            # stop at the old line starting where the next line starts
+            if end is None or wraps[-1] < end: continue
+            key = (wraps[-1] - d, wrapped)
+            while o < n and (old_wraps[o], old_lines[o].wrapped) < key: o += 1
+            if o < n and (old_wraps[o], old_lines[o].wrapped) == key:
+                wraps.pop()
+                break
+
+        else:
+            line = render(linebuff, 0, color, bkg)
+            lines.append(Line(line, Rect(dest.topleft, line.get_size()),
+                              wrapped))
+            o = n
+
+        kept = old_lines[o:]
+        if kept: dy = dest.y - kept[0].rect.y
+        else: dy = 0
+        if dy: cleared = old_lines[l:]
+        else: cleared = old_lines[l:o]
+        for line in cleared: image.blit(bkg_img, line.rect, line.rect)
+        for line in lines[l:]: image.blit(line.image, line.rect)
+        if dy:
+            for line in kept:
+                line.rect.y += dy
+                image.blit(line.image, line.rect)
+
+        if d: wraps.extend(w + d for w in old_wraps[o:])
+        else: wraps.extend(old_wraps[o:])
+        self._lines = lines + kept
         self._wraps = wraps
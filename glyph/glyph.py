@@ -5,14 +5,13 @@
 
 
 from __future__ import division
+from bisect import bisect_left, bisect_right
 import re
 from collections import defaultdict, deque
-import os
+from multiprocessing.pool import ThreadPool
 from sys import stderr
 
-import pygame
 from pygame import font
-from pygame.event import Event
 from pygame.font import Font
 from pygame.rect import Rect
 from pygame.sprite import Sprite
@@ -20,7 +19,9 @@ from pygame import Surface
 from pygame.transform import scale
 from pygame.locals import *
 
+from .cache import FontPool, ImageCache, LRUCache
 from .editor import Editor
+from .stats import Stats
 
 
 
@@ -41,14 +42,85 @@ SPECIALS = ['/', '{', '}']
 WHITESPACE = {'n' : '\n'}
 WARN_BUFF = '''\
 Warning: buffer not emptied, try increasing rect height or rect width and add
-more columns\n'''
+more columns, or lay the text out as pages with Paginator\n'''
+SPACES = frozenset(' \t\n\r\f\v') # the characters glyph treats as whitespace
+CHUNK = 64 * 1024 # the size of the chunks read from files streamed to glyphs
+# the characters glyph atlases hold
+PRINTABLE = ''.join(chr(i) for i in xrange(32, 127))
+_BLITS = hasattr(Surface, 'blits') # Surface.blits is new in pygame 1.9.4
+# lexeme types
+_TEXT, _SPECIAL, _FUNC, _ENV, _CLOSE = range(5)
+# compiled document opcodes
+_CHARS, _CALL, _PUSH, _FONT, _EDITOR, _POP = range(6)
+# res used by the lexer
+_RE_TEXT = re.compile('[^/{}]+') # a run of plain text
+_RE_WORDS = re.compile('[ \t\n\r\f\v]|[^ \t\n\r\f\v]+') # whitespace or words
+# env arguments (arguments may be paths and contain \ or /)
+_RE_ENV = re.compile('(\w+)(\s+((\"|\').*?(\"|\')|.*?))?;')
+_RE_FUNC = re.compile('(\w+){(.*?)}') # function name and arguments
 
 
 
 
 ######################################################################
 # globals
-Macros = {}
+class _MacroDict(dict):
+    # dictionary of macros.  counts its modifications so that compiled
+    # documents can be keyed by the macro state they were compiled against
+
+
+    def __init__(self, *a, **kw):
+        dict.__init__(self, *a, **kw)
+        self.version = 0
+
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self.version += 1
+
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self.version += 1
+
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
+
+    def pop(self, *a):
+        self.version += 1
+        return dict.pop(self, *a)
+
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+
+    def setdefault(self, k, v=None):
+        self.version += 1
+        return dict.setdefault(self, k, v)
+
+
+    def update(self, *a, **kw):
+        dict.update(self, *a, **kw)
+        self.version += 1
+
+
+Macros = _MacroDict()
+_COMPILED = LRUCache(64) # compiled documents keyed by (txt, Macros.version)
+Tokens = LRUCache(4096) # built tokens, shared by default between all Glyphs
+Fonts = FontPool(32) # fonts opened by font environments
+Images = ImageCache() # images loaded by the img function
+# glyph atlases keyed by (font key, color, bkg), where font key is as for
+# _font_key
+Atlases = LRUCache(64)
+# (advances, kerned pairs) of fonts, keyed as for _font_key
+_CELLS = LRUCache(64)
+_STATS = None # the Stats of the instrumented glyph at work, or None
+_POOL = None # the ThreadPool of input_async, started on first use
 
 
 
@@ -60,137 +132,724 @@ def _iswhitespace(char):
     # accepts a char, if char is not a string then it is never
     # considered whitespace (to prevent images from being stretched)
     # returns true if char is whitespace, else returns false
-    whitespace = re.compile('\s+') # re to detect whitespace
     if not char: return True
-    if isinstance(char, str) or isinstance(char, unicode):
-        assert len(char) == 1
-        if whitespace.search(char): return True
-        return False
+    if isinstance(char, basestring): return char in SPACES
     return False
 
 
 
-def _scale_token(token, (width, height)):
-    # scale token to width and height
-    # accepts token object and a (width, height) argument
-    # returns a new token object scaled to width and height
-    Token = _Token
-
-    links = token.links
-    token_iswhitespace, token_str = token.iswhitespace, token.str
-    surfs = [scale(token, (width, height))]
-
+def _font_key(font):
+    # key a font by its style as well as by the font, since a font drawn bold,
+    # italic, or underlined once its style is set draws other pixels
+    # accepts a font
+    # returns a (font, bold, italic, underline) tuple
+    return (font, font.get_bold(), font.get_italic(), font.get_underline())
+
+
+
+def _cells(font):
+    # get the characters of a font that can be drawn from cells of an atlas:
+    # printable characters drawn within their advance, so that a character
+    # drawn next to another does not overlap it.  pairs of these characters
+    # that the font kerns are not drawn from cells
+    # accepts a font
+    # returns an (advances, kerns) pair, where advances is a dictionary of
+    #   character advances keyed to the characters, and kerns is a set of the
+    #   two character strings the font kerns
+    key = _font_key(font)
+    cells = _CELLS.get(key)
+    if cells is not None: return cells
+
+    advances = {}
+    if not font.get_underline(): # underlines are drawn across a whole text
+        for char, metrics in zip(PRINTABLE, font.metrics(PRINTABLE)):
+            if metrics is None: continue
+            minx, maxx, miny, maxy, advance = metrics
+            if minx >= 0 and maxx <= advance and font.size(char)[0] == advance:
+                advances[char] = advance
+    size = font.size
+    kerns = set(a + b for a in advances for b in advances
+                if size(a + b)[0] != advances[a] + advances[b])
+    return _CELLS.put(key, (advances, kerns))
+
+
+
+def _draw_text(surf, pos, txt, font, color, bkg):
+    # draw text on a surface by copying its characters from the glyph atlas
+    # of its font, color, and background, building the atlas on first use
+    # accepts a surface, the (x, y) to draw the text at, a text string, and
+    #   the font, color, and background of the text
+    # returns true if the text was drawn, or false if it cannot be drawn
+    #   from an atlas and must be rendered with the font
+    if bkg is None: return False # text rendered without bkg is alpha blended
+    key = (_font_key(font), tuple(color), tuple(bkg))
+    atlas = Atlases.get(key)
+    if atlas is None: atlas = Atlases.put(key, _Atlas(font, color, bkg))
+    return atlas.draw(surf, pos, txt)
+
+
+
+def _chunks(source):
+    # get the chunks of text of a source streamed to a glyph
+    # accepts a string, a file-like object with a read method, or an
+    #   iterable of strings
+    # returns an iterable of strings
+    if isinstance(source, basestring): return [source]
+    read = getattr(source, 'read', None)
+    if read is not None: return iter(lambda: read(CHUNK), '')
+    return source
+
+
+
+def _pool():
+    # get the thread pool input_async lays out text in, starting it on first
+    # use.  the pool has one thread: layout holds the interpreter lock, so
+    # more threads would not lay out text sooner, and one thread lays out
+    # the text input to a glyph in the order it was input
+    # accepts nothing
+    # returns a ThreadPool object
+    global _POOL
+    if _POOL is None: _POOL = ThreadPool(1)
+    return _POOL
+
+
+
+def _instrumented(stats, name, method):
+    # wrap a method so that each call is timed as a stage of stats, and the
+    # surfaces and font renders made during the call are counted by stats
+    # accepts a Stats object, the stage name, and a bound method
+    # returns the wrapped method
+    def call(*a, **kw):
+        global _STATS
+        outer, _STATS = _STATS, stats
+        mark = stats.begin(name)
+        try: return method(*a, **kw)
+        finally:
+            stats.end(name, mark)
+            _STATS = outer
+    return call
+
+
+
+def _stretch_links(token, width):
+    # stretch the link rects of a token to a new token width
+    # accepts token object and the width the token is stretched to
+    # returns a dictionary of link id strings keyed to the stretched link rects
+    #   of the token.  token link rects may be shared with cached tokens, so
+    #   the stretched rects are copies
+    height = token.get_height()
     ratio_w = width / token.get_width()
-    ratio_h = height / token.get_height()
 
     # given token height, modify link rect y
+    links = defaultdict(list)
     shift_x = 0
-    for rect in [rect for v in links.values() for rect in v]:
-        rect_w = rect.w
-        rect.w *= ratio_w
-        rect.h *= ratio_h
-        rect.x += shift_x
-        rect.y += (height - rect.h)    
-        shift_x = rect.w - rect_w
+    for link, v in token.links.items():
+        for rect in v:
+            rect = Rect(rect)
+            rect_w = rect.w
+            rect.w *= ratio_w
+            rect.x += shift_x
+            rect.y += (height - rect.h)    
+            shift_x = rect.w - rect_w
+            links[link].append(rect)
 
-    return Token((width, height), links, surfs, token_iswhitespace, token_str)
+    return links
 
 
 
-def _token_builder(interpreted_txt):
-    # build a token from interpreted text
-    # accepts an interpreted text list
+def _token_builder(interpreted_txt, cache=None):
+    # build a token from interpreted text.  only the token layout is
+    # computed, the token is rendered when its line is rendered
+    # accepts an interpreted text list, and optionally a LRUCache of token
+    #   shapes
     # returns a token object
     iswhitespace = _iswhitespace
-    Token = _Token
-
-    links = defaultdict(list)
+    Token, Shape = _Token, _Shape
+
+    # token shapes are cached without their link ids, so that a cached shape
+    # can be reused under any link.  tokens containing surfaces are not cached
+    # because the surfaces may be changed between inputs
+    key = None
+    if cache is not None:
+        try:
+            key = tuple((''.join(chars), _font_key(envs['font']),
+                         envs['color'], envs['bkg'])
+                        for (envs, chars) in interpreted_txt)
+            shape = cache.get(key)
+        except TypeError: key = None
+        else:
+            if shape is not None:
+                return Token(shape, _link_rects(interpreted_txt, shape.rects))
+
+    rects = [] # list of (i, rect) pairs, i indexes the link of the rect
 
     token_iswhitespace = True
 
-    surfs, x, y = [], 0, 0
-    for (envs, chars) in interpreted_txt:
+    # pieces is a list of (x, height, piece, font, color, bkg) tuples, where
+    # piece is a text string to render, a surface, or None for a newline
+    pieces, x = [], 0
+    for i, (envs, chars) in enumerate(interpreted_txt):
         bkg, color, font = envs['bkg'], envs['color'], envs['font']
-        strbuff, surfbuff = [], []
+        strbuff, piecebuff = [], []
         for char in chars:
             if not iswhitespace(char): token_iswhitespace = False
 
-            if char == '\n':
-              char = Surface((0, font.get_linesize()))
-
-            if isinstance(char, unicode):
+            if isinstance(char, basestring) and char != '\n':
                 if iswhitespace(char): char = ' '
                 strbuff.append(char)
-            elif isinstance(char, str):
-                if iswhitespace(char): char = ' '
-                strbuff.append(char)            
             else:
                 if strbuff:
-                  surfbuff.append(font.render(''.join(strbuff), 1, color, bkg))
-                surfbuff.append(char)
+                    strbuff = ''.join(strbuff)
+                    piecebuff.append((font.size(strbuff), strbuff))
+                if char == '\n': piecebuff.append(((0, font.get_linesize()), None))
+                else: piecebuff.append((char.get_size(), char))
                 strbuff = []
-        
+
         if strbuff:
-          surfbuff.append(font.render(''.join(strbuff), 1, color, bkg))
+            strbuff = ''.join(strbuff)
+            piecebuff.append((font.size(strbuff), strbuff))
 
-        if surfbuff:
+        if piecebuff:
             # calculate link rects
-            link = envs['link']
-            surfbuff_w = sum(surf.get_width() for surf in surfbuff)
-            surfbuff_h = max(surf.get_height() for surf in surfbuff)
-            links[link].append(Rect(x, 0, surfbuff_w, surfbuff_h))
-            x += surfbuff_w
-            # extend surfbuff to surfs and reset surfbuff
-            surfs.extend(surfbuff)
-            surfbuff = []
+            piecebuff_w = sum(w for ((w, h), piece) in piecebuff)
+            piecebuff_h = max(h for ((w, h), piece) in piecebuff)
+            rects.append((i, Rect(x, 0, piecebuff_w, piecebuff_h)))
+            # extend piecebuff to pieces
+            for ((w, h), piece) in piecebuff:
+                pieces.append((x, h, piece, font, color, bkg))
+                x += w
 
     # get token width and height
-    width = sum(surf.get_width() for surf in surfs)
-    height = max(surf.get_height() for surf in surfs)
+    width = x
+    height = max(h for (x, h, piece, font, color, bkg) in pieces)
 
     # given token height, modify link rect y
-    for rect in [rect for v in links.values() for rect in v]:
-        rect.y += (height - rect.h)
+    for i, rect in rects: rect.y += (height - rect.h)
     token_str = ''.join(unicode(char) for (envs, chars) in interpreted_txt
                         for char in chars)
 
-    return Token((width, height), links, surfs, token_iswhitespace, token_str)
+    shape = Shape((width, height), pieces, rects, token_iswhitespace, token_str,
+                  key, cache)
+    if key is not None: cache.put(key, shape)
+    return Token(shape, _link_rects(interpreted_txt, rects))
 
 
 
+def _link_rects(interpreted_txt, rects):
+    # attach the link ids of interpreted text to the link rects of a token
+    # accepts an interpreted text list and a list of (i, rect) pairs, where i
+    #   indexes the interpreted text the rect belongs to
+    # returns a dictionary of link id strings keyed to the link rects
+    links = defaultdict(list)
+    for i, rect in rects: links[interpreted_txt[i][0]['link']].append(rect)
+    return links
+
+
+
+def _paragraphs(interpreted_txt):
+    # splits interpreted text into paragraphs, each ending after a newline
+    # accepts an interpreted text list
+    # returns a generator of the interpreted text lists of the paragraphs.
+    #   paragraphs that hold no characters are dropped
+    para, nchars = [], 0
+    for envs, chars in interpreted_txt:
+        start = 0
+        for i, char in enumerate(chars):
+            if char == '\n':
+                para.append((envs, chars[start:i + 1]))
+                yield para
+                para, nchars, start = [], 0, i + 1
+        if start < len(chars):
+            para.append((envs, chars[start:]))
+            nchars += len(chars) - start
+        elif not start: para.append((envs, chars))
+    if nchars: yield para
+
+
+
+def _cut(interpreted_txt, i):
+    # splits interpreted text at a character position.  positions count the
+    # characters of text, and count each surface as one character
+    # accepts an interpreted text list, and the position to split it at
+    # returns (head, tail) interpreted text lists
+    head = []
+    for n, (envs, chars) in enumerate(interpreted_txt):
+        for m, char in enumerate(chars):
+            if isinstance(char, basestring): size = len(char)
+            else: size = 1
+            if i < size:
+                if i:
+                    head.append((envs, list(chars[:m]) + [char[:i]]))
+                    tail = [(envs, [char[i:]] + list(chars[m + 1:]))]
+                else:
+                    if m: head.append((envs, chars[:m]))
+                    tail = [(envs, chars[m:])]
+                return head, tail + interpreted_txt[n + 1:]
+            i -= size
+        head.append((envs, chars))
+    return head, []
+
+
+
+def _coalesce(rects):
+    # merges rects that are stacked in the same column, such as the rects of
+    # consecutive lines, and drops rects inside the rect before them
+    # accepts a list of rects
+    # returns a list of new rects
+    coalesced = []
+    for rect in sorted(rects, key=lambda rect: (rect.x, rect.y)):
+        if coalesced:
+            last = coalesced[-1]
+            if last.contains(rect): continue
+            if (last.x == rect.x and last.w == rect.w
+                and last.top <= rect.top <= last.bottom):
+                last.union_ip(rect)
+                continue
+        coalesced.append(Rect(rect))
+    return coalesced
+
+
+
+def _lex(txt, done=None):
+    # splits glyph markup into lexemes in a single pass
+    # accepts string literal, and optionally a list done.  if done is given,
+    #   more markup may follow txt: lexing stops before a lexeme that may go
+    #   on past the end of txt, or before whitespace ending txt, and the
+    #   position lexing stopped at is appended to done
+    # yields (lexeme type, value) pairs, where lexeme type is one of
+    #   _TEXT: value is a run of plain text
+    #   _SPECIAL: value is a special or whitespace character
+    #   _FUNC: value is a (function name, arguments) pair
+    #   _ENV: value is an (environment name, arguments) pair
+    #   _CLOSE: value is None
+    text, env, func = _RE_TEXT.match, _RE_ENV.search, _RE_FUNC.search
+    find = txt.find
+
+    pos, n = 0, len(txt)
+    while pos < n:
+        m = text(txt, pos)
+        if m: # plain text, up to the next special character
+            value = m.group()
+            if done is not None and m.end() == n:
+                # whitespace ending txt may be the end of the document,
+                # which is stripped
+                value = value.rstrip()
+                if value: yield _TEXT, value
+                pos += len(value)
+                break
+            yield _TEXT, value
+            pos = m.end()
+            continue
+
+        char = txt[pos]
+        if char == '/': # a function:
+            char = txt[pos + 1:pos + 2]
+            if not char and done is not None: break
+            if char in SPECIALS:
+                yield _SPECIAL, char
+                pos += 2
+            elif char in WHITESPACE:
+                yield _SPECIAL, WHITESPACE[char]
+                pos += 2
+            else:
+                m = func(txt, pos + 1)
+                if not m:
+                    if done is not None: break
+                    raise ValueError('unterminated function at ' + str(pos))
+                yield _FUNC, m.groups()
+                pos = m.end()
+
+        elif char == '{': # a new environment has started
+            # the declaration ends at the first semi-colon that completes a
+            # match for an environment name and arguments
+            end = pos
+            while True:
+                end = find(';', end + 1)
+                if end < 0: break
+                m = env(txt, pos + 1, end + 1)
+                if m: break
+            if end < 0:
+                if done is not None: break
+                raise ValueError('unterminated environment at ' + str(pos))
+            groups = m.groups()
+            yield _ENV, (groups[0], groups[2])
+            pos = end + 1
+
+        else: # an environment has ended
+            yield _CLOSE, None
+            pos += 1
+    if done is not None: done.append(pos)
+
+
+
+def _env_op(env, args):
+    # interprets an environment declaration.  environments set text
+    # characteristics such as color or links.
+    # accepts the environment name and arguments
+    # returns an (opcode, argument) pair for the compiled document
+    if env in Macros: return _PUSH, Macros[env]
+    # new environment types must be added here
+
+    elif env == 'bkg':
+        # return new backgroun color
+        return _PUSH, ('bkg', tuple([int(e) for e in args.split(',')]))
+
+    elif env == 'color':
+        # return new font color
+        return _PUSH, ('color', tuple([int(e) for e in args.split(',')]))
+
+    elif env == 'font':
+        # return the font location and size; the font is opened when the
+        # document is interpreted
+        path, size = args.split(',')
+        return _FONT, (path, int(size))
+
+    elif env == 'link':
+        # return new link
+        return _PUSH, ('link', args.strip())
+
+    # FUTURE ###
+    elif env == 'editor':
+        # return the editor name and width; the editor is created when the
+        # document is interpreted
+        name, w = args.split(',')
+        return _EDITOR, (name, int(w))
+    ############
+
+    else:
+        raise ValueError(env + ' is an unrecognized environment')
+
+
+
+# the space func could take a size and return a surface or rect...
+# really only need to shift tokens.  surfs do that without requiring tokens
+# to have rects
+def _func_op(func, args):
+    # interprets a function.  functions are special surfaces or objects.
+    # accepts the function name and arguments
+    # returns an (opcode, argument) pair for the compiled document
+    #   (eg. (_CHARS, Surface obejct)).  functions that load resources are
+    #   returned as (_CALL, (function type, arguments)) pairs
+    if func in Macros: return _CHARS, Macros[func]
+
+    if func == 'space': return _CHARS, Surface((int(args), 1))
+
+    if func == 'img':
+        # the image location, and optionally the size to rescale to
+        args = args.split(',')
+        if len(args) == 1: return _CALL, (func, (args[0], None))
+        elif len(args) == 3:
+            path, w, h = args
+            return _CALL, (func, (path, (int(w), int(h))))
+        else:
+            raise ValueError('img takes a location, or a location, width, '
+                             'and height')
+
+    raise ValueError(func + ' is an unrecognized function')
+
+
+
+def _compile(txt):
+    # compiles glyph markup into a document that can be interpreted without
+    # reparsing the markup.  compiled documents are cached by txt and macro
+    # state
+    # accepts string literal
+    # returns a tuple of (opcode, argument) pairs, where opcode is one of
+    #   _CHARS: argument is a tuple of words, whitespace characters and
+    #     surfaces
+    #   _CALL: argument is a (function type, arguments) pair
+    #   _PUSH: argument is an (env_id, value) pair
+    #   _FONT: argument is a (path, size) pair
+    #   _EDITOR: argument is a (name, width) pair
+    #   _POP: argument is None
+    key = (txt, Macros.version)
+    document = _COMPILED.get(key)
+    if document is not None: return document
+
+    compiler = _Compiler()
+    compiler.feed(_lex(txt.strip()))
+    compiler.flush()
+    return _COMPILED.put(key, tuple(compiler.document))
+
+
+
+def _compile_stream(chunks):
+    # compiles glyph markup read in chunks, as _compile, yielding the
+    # compiled document as it is compiled.  markup cut by the end of a chunk
+    # is compiled once the chunks that complete it are read
+    # accepts an iterable of strings
+    # yields lists of (opcode, argument) pairs, as for _compile
+    compiler, txt = _Compiler(), ''
+    for chunk in chunks:
+        txt += chunk
+        if not compiler.begun:
+            # whitespace starting the document is stripped
+            txt = txt.lstrip()
+            if not txt: continue
+            compiler.begun = True
+        done = []
+        compiler.feed(_lex(txt, done))
+        txt = txt[done[0]:]
+        compiler.flush(False)
+        if compiler.document:
+            yield compiler.document
+            compiler.document = []
+    compiler.feed(_lex(txt.rstrip()))
+    compiler.flush()
+    if compiler.document: yield compiler.document
+
+
 
 ######################################################################
 # private classes
-class _Token(Surface):
+class _Compiler(object):
+    # compiles the lexemes of glyph markup into a document.  lexemes may be
+    # fed in parts, so that a document is compiled as its markup is read
+    # document is the list of (opcode, argument) pairs compiled
+    # charbuff holds the words and single whitespace characters not yet
+    #   added to the document
+    # prevchar is the last word, character, or surface compiled
+    # begun is a flag that streamed markup has begun
+
+
+    def __init__(self):
+        self.document, self.charbuff, self.prevchar = [], [], ''
+        self.begun = False
+
+
+    def feed(self, lexemes):
+        # compiles lexemes
+        # accepts an iterable of (lexeme type, value) pairs, as from _lex
+        # returns nothing
+        iswhitespace, words = _iswhitespace, _RE_WORDS.findall
+        charbuff, document, prevchar = (self.charbuff, self.document,
+                                        self.prevchar)
+        for lexeme, value in lexemes:
+            if lexeme == _TEXT: # normal, string, characters
+                for word in words(value):
+                    if iswhitespace(word) and iswhitespace(prevchar):
+                        if word == '\n' and charbuff: charbuff[-1] = word
+                        continue
+                    charbuff.append(word)
+                    prevchar = word
+
+            elif lexeme == _SPECIAL: # a special or whitespace character
+                charbuff.append(value)
+                prevchar = value
+
+            elif lexeme == _FUNC: # a function:
+                op, char = _func_op(*value)
+                if op == _CALL:
+                    if charbuff: document.append((_CHARS, tuple(charbuff)))
+                    charbuff = []
+                    document.append((op, char))
+                else: charbuff.append(char)
+                prevchar = char
+
+            elif lexeme == _ENV: # a new environment has started
+                if charbuff: document.append((_CHARS, tuple(charbuff)))
+                charbuff = []
+                document.append(_env_op(*value))
+
+            else: # an environment has ended
+                if charbuff: document.append((_CHARS, tuple(charbuff)))
+                charbuff = []
+                document.append((_POP, None))
+        self.charbuff, self.prevchar = charbuff, prevchar
+
+
+    def flush(self, final=True):
+        # adds the words of charbuff to the document.  unless final, a
+        # whitespace character ending charbuff is kept, so that a newline
+        # compiled after it can still replace it
+        # accepts optionally the final flag
+        # returns nothing
+        charbuff = self.charbuff
+        if not final and charbuff and _iswhitespace(charbuff[-1]):
+            keep = charbuff[-1:]
+            charbuff = charbuff[:-1]
+        else: keep = []
+        if charbuff: self.document.append((_CHARS, tuple(charbuff)))
+        self.charbuff = keep
+
+
+
+class _Shape(object):
+    # the layout of a token, without its link ids.  shapes may be cached and
+    # shared between tokens
+    # size is the (width, height) of the token
+    # pieces is a list of (x, height, piece, font, color, bkg) tuples, where
+    #   piece is a text string to render, a surface, or None for a newline
+    # rects is a list of (i, rect) pairs, where i indexes the interpreted text
+    #   the link rect belongs to
+    # iswhitespace is a boolean indicating if the token is whitespace
+    # str is a string representing the token content
+    # surf is the rendered token, or None if it is not rendered or has been
+    #   released
+    # key and cache are the key the shape is cached at and the LRUCache it is
+    #   cached in, or None if the shape is not cached
+    __slots__ = ('size', 'pieces', 'rects', 'iswhitespace', 'str', 'surf',
+                 'key', 'cache')
+
+
+    def __init__(self, size, pieces, rects, iswhitespace, token_str,
+                 key=None, cache=None):
+        self.size = size
+        self.pieces = pieces
+        self.rects = rects
+        self.iswhitespace = iswhitespace
+        self.str = token_str
+        self.surf = None
+        self.key = key
+        self.cache = cache
+
+
+    def get_width(self):
+        return self.size[0]
+
+
+    def get_height(self):
+        return self.size[1]
+
+
+    def render(self, atlas=False):
+        # render the token, or get the previously rendered token
+        # accepts optionally a flag to draw text from glyph atlases where it
+        #   can be, rather than rendering it
+        # returns a surface, it may be shared and must not be drawn on
+        surf = self.surf
+        if surf is None:
+            width, height = self.size
+            surf = Surface((width, height))
+            stats = _STATS
+            if stats is not None: stats.surface(surf)
+            for (x, h, piece, font, color, bkg) in self.pieces:
+                if piece is None: continue # newlines are not drawn
+                if isinstance(piece, basestring):
+                    if atlas and _draw_text(surf, (x, height - h), piece,
+                                            font, color, bkg): continue
+                    piece = font.render(piece, 1, color, bkg)
+                    if stats is not None:
+                        stats.count('font_renders')
+                        stats.surface(piece)
+                surf.blit(piece, (x, height - h))
+            self.surf = surf
+        return surf
+
+
+    def get_fill(self):
+        # get the color whitespace is stretched with, without rendering it:
+        # the background of its spaces, if one background covers the token
+        # and no underline is drawn across it
+        # accepts nothing
+        # returns a color, or None if the token must be scaled to stretch it
+        height, fill = self.size[1], None
+        for (x, h, piece, font, color, bkg) in self.pieces:
+            # newlines are not drawn, and shorter pieces leave the token
+            # uncovered
+            if (not isinstance(piece, basestring) or h != height or bkg is None
+                or font.get_underline()): return None
+            if fill is None: fill = bkg
+            elif tuple(bkg) != tuple(fill): return None
+        return fill
+
+
+    def release(self):
+        # free the rendered token, unless the token cache holds the shape, so
+        # that the pixels of a word are not kept after it is drawn to its line
+        # accepts nothing
+        # returns nothing
+        if self.key is None or self.key not in self.cache: self.surf = None
+
+
+
+class _Atlas(object):
+    # the characters of a font rendered in a color on a background, so that
+    # text is drawn by copying each character from its cell of the atlas,
+    # rather than by rendering the text.  text drawn from an atlas has the
+    # same pixels as the text rendered by the font
+    # cells is a dictionary of (cell, advance) pairs keyed to their
+    #   characters, where cell is the rendered character
+    # kerns is a set of the two character strings the font kerns
+
+
+    def __init__(self, font, color, bkg):
+        self.font, self.bkg = font, bkg
+        advances, self.kerns = _cells(font)
+        self.cells = cells = {}
+        stats = _STATS
+        for char, advance in advances.iteritems():
+            # rendered characters are palettized.  cells are copied to the
+            # format of the surfaces text is drawn on once, here, rather than
+            # being mapped to it on every blit
+            rendered = font.render(char, 1, color, bkg)
+            cell = Surface(rendered.get_size())
+            cell.blit(rendered, (0, 0))
+            if stats is not None:
+                stats.count('font_renders')
+                stats.count('atlas_cells')
+                stats.surface(rendered)
+                stats.surface(cell)
+            cells[char] = (cell, advance)
+
+
+    def draw(self, surf, pos, txt):
+        # draw text on a surface with one batched blit of its characters
+        # accepts a surface, the (x, y) to draw the text at, and a text string
+        # returns true if the text was drawn, or false if a character is not
+        #   in the atlas or a pair of characters is kerned, and nothing is
+        #   drawn
+        cells, kerns = self.cells, self.kerns
+        x, y = pos
+        x0, blits, prev = x, [], ''
+        for char in txt:
+            try: cell, advance = cells[char]
+            except KeyError: return False
+            if kerns and prev + char in kerns: return False
+            blits.append((cell, (x, y)))
+            x += advance
+            prev = char
+        # a cell is as high as its character is rendered, and the text as
+        # high as the text is rendered, so the background is drawn under the
+        # cells where they are shorter than the text
+        surf.fill(self.bkg, (x0, y, x - x0, self.font.size(txt)[1]))
+        if _BLITS: surf.blits(blits, 0)
+        else:
+            for cell, dest in blits: surf.blit(cell, dest)
+        return True
+
+
+
+class _Token(object):
     # token object
+    # shape is the token layout, it may be shared with other tokens
     # links is a dictionary of link id strings keyed to the link rect on the
     #   token
     # iswhitespace is a boolean indicating if the token is whitespace
     # str is a string representing the token content
 
 
-    def __init__(self, (width, height), links, surfs, iswhitespace, token_str):
-        # construct a token object
-        # (width, height) is the width and height of the token
-        # links is a dictionary of link id strings keyed to the link rect on the
-        #   token
-        # surfs is a list of surfaces comprising the token
-        # iswhitespace is a boolean indicating if the token is whitespace
-        # token_str is a string representing the token
+    def __init__(self, shape, links):
+        self.shape = shape
         self.links = links
-        self.iswhitespace = iswhitespace
-        self.str = token_str
+        self.iswhitespace = shape.iswhitespace
+        self.str = shape.str
+
+
+    def get_width(self):
+        return self.shape.size[0]
+
+
+    def get_height(self):
+        return self.shape.size[1]
+
+
+    def get_size(self):
+        return self.shape.size
 
-        # construct Surface superclass
-        Surface.__init__(self, (width, height))
 
-        # blit each token onto self
-        x = 0
-        for surf in surfs:
-            w, h = surf.get_size()
-            y = height - h
-            self.blit(surf, (x, y))
-            x += w
+    def render(self, atlas=False):
+        return self.shape.render(atlas)
 
 
     def __str__(self):
@@ -198,20 +857,128 @@ class _Token(Surface):
 
 
 
-class _Line(Surface):
-    # Line class
+class _Run(object):
+    # a run of text pieces that share a style on a line, rendered with one
+    # font render.  the run may span whitespace stretched by justification:
+    # the whitespace is rendered with the run but not drawn, and the text
+    # after it is cut from the run and drawn where it is placed
+    # txt is the text of the run
+    # size is the (width, height) of the run, rendered
+    # slices is a list of (x, dx, width, txt) slices of the run drawn on the
+    #   line, where x is the x of the slice in the rendered run, dx the x of
+    #   the slice on the line, from the run, and txt the text of the slice
+    # x is the x of the run on the line
+    # end is the (x, y) on the line of the next piece to join the run
+
+
+    def __init__(self, txt, size, font, color, bkg, x=0):
+        self.txt = txt
+        self.size = size
+        self.font = font
+        self.color = color
+        self.bkg = bkg
+        self.slices = [(0, 0, size[0], txt)]
+        self.x = x
+        self.end = (x + size[0], 0)
+
+
+    def joins(self, x, y, piece, font, color, bkg):
+        # determine if a piece of text placed on the line at (x, y) can join
+        # the run: it is placed where the run ends, in the style of the run,
+        # and the run is as wide with the piece as without it plus the width
+        # of the piece, so that kerning between pieces cannot move the text
+        # accepts the (x, y) of the piece, and its text and style
+        # returns true if the piece can join the run, else false
+        return ((x, y) == self.end
+                and (font, color, bkg) == (self.font, self.color, self.bkg)
+                and (font.size(self.txt + piece)[0]
+                     == self.size[0] + font.size(piece)[0]))
+
+
+    def get_width(self):
+        return self.size[0]
+
+
+    def get_height(self):
+        return self.size[1]
+
+
+    def render(self):
+        surf = self.font.render(self.txt, 1, self.color, self.bkg)
+        if _STATS is not None:
+            _STATS.count('font_renders')
+            _STATS.surface(surf)
+        return surf
+
+
+    def blit(self, surf, pos):
+        # render the run and draw its slices on a surface
+        # accepts a surface and the (x, y) to draw the run at
+        # returns nothing
+        x, y = pos
+        run_surf, slices = self.render(), self.slices
+        if len(slices) == 1: surf.blit(run_surf, pos)
+        else:
+            h = self.size[1]
+            for (sx, dx, w, txt) in slices:
+                surf.blit(run_surf, (x + dx, y), (sx, 0, w, h))
+
+
+    def draw(self, surf, pos):
+        # draw the slices of the run on a surface from a glyph atlas
+        # accepts a surface and the (x, y) to draw the run at
+        # returns true if the run was drawn, else false
+        x, y = pos
+        font, color, bkg = self.font, self.color, self.bkg
+        for (sx, dx, w, txt) in self.slices:
+            if not _draw_text(surf, (x + dx, y), txt, font, color, bkg):
+                return False
+        return True
+
+
+
+class _Paragraph(object):
+    # a paragraph of input text: interpreted text ending after a newline, or
+    # at the end of an input
+    # txt is the interpreted text of the paragraph
+    # justify is the justify command the paragraph is wrapped with
+    # lines is the list of Line objects the paragraph is wrapped to
+
+
+    def __init__(self, txt, justify, lines):
+        self.txt = txt
+        self.justify = justify
+        self.lines = lines
+
+
+
+class _Line(object):
+    # Line class.  a line keeps the shapes of its tokens and where they are
+    # placed, not the tokens, and releases the rendered shapes once it is
+    # rendered, so a laid out document holds no pixels but its images
+    # links is a dictionary of link id strings keyed to the link rects on the
+    #   line
+    # text_w is the width covered by the text of the line
+    # pos is the topleft of the line on the glyph image, or None if the line
+    #   has not been placed on the image
+    # col is the column the line is placed in
+    # size is the (width, height) of the line
+    # str is the text of the line
+    __slots__ = ('links', 'pos', 'col', 'size', 'text_w', 'str',
+                 '_placements')
 
 
     def __init__(self, line, surf_w, justify):
-        # renders a line (list of tokens)
+        # lays out a line (list of tokens).  the line is not rendered until
+        # its render method is called
         # accepts a line (list of tokens), width of line, and justification
-        # returns Surface object with the tokens justified upon it given the
-        #   justify argument
-        self.line = line
+        self.str = u''.join(token.str for token in line)
         self.links = defaultdict(list)
+        self.pos = None
+        self.col = None
 
         links = self.links
-        scale_token = _scale_token
+        stretch_links = _stretch_links
 
         # get the line width, line height, whitespace used in the line, and
         # freespace remaining in the line
@@ -225,14 +992,17 @@ class _Line(Surface):
                                if token.iswhitespace)
         freespace = surf_w - line_w # the freespace available in the surface
 
-        # initialize surface
-        Surface.__init__(self, (surf_w, line_h))
-        self.set_colorkey(BLACK)
+        self.size = (surf_w, line_h)
 
         # set x
         if justify == 'right': x = freespace
         elif justify == 'center': x = freespace / 2
         else: x = 0
+        x0 = x
+
+        # widths and link dictionaries of the tokens
+        widths = [token.get_width() for token in line]
+        token_links = [token.links for token in line]
 
         # if justified: modify whitespace widths
         if justify == 'justified':
@@ -242,31 +1012,235 @@ class _Line(Surface):
 
             sub_w = 0
             for i, token in enumerate(line):
-                if token.iswhitespace:
-                    # replace token with a scaled token
-                    token_w = token.get_width() * stretch
+                if token.iswhitespace and widths[i]:
+                    # stretch token width
+                    token_w = widths[i] * stretch
                     scale_w = int(token_w)
                     sub_w += token_w % scale_w
                     while sub_w > 1:
                         sub_w -= 1
                         scale_w += 1
-                    line[i] = scale_token(token, (scale_w, token.get_height()))
+                    widths[i] = scale_w
+                    token_links[i] = stretch_links(token, scale_w)
 
-        for token in line:
-            w, h = token.get_size()
+        # the (shape, x, y, width) placement of each token on the line
+        self._placements = placements = []
+        for token, w, token_link in zip(line, widths, token_links):
+            h = token.get_height()
             y = (line_h - h) # token y
-            self.blit(token, (x, y))
+            placements.append((token.shape, x, y, w))
 
-            for link in token.links:
-                for rect in token.links[link]:
+            for link in token_link:
+                for rect in token_link[link]:
                     # move rect to token's position in line and append to links
                     links[link].append(rect.move(x, y))
 
             x += w # update x with object width
 
+        self.text_w = x - x0
+
+
+    def copy(self):
+        # get an unplaced copy of the line with link rects of its own, so
+        # that placing the copy does not move the link rects of the line
+        # accepts nothing
+        # returns a _Line object
+        line = _Line.__new__(_Line)
+        line.str, line.size, line.text_w = self.str, self.size, self.text_w
+        line._placements = self._placements
+        line.links = links = defaultdict(list)
+        for link, rects in self.links.iteritems():
+            links[link] = [Rect(_rect) for _rect in rects]
+        line.pos = line.col = None
+        return line
+
+
+    def get_width(self):
+        return self.size[0]
+
+
+    def get_height(self):
+        return self.size[1]
+
+
+    def get_size(self):
+        return self.size
+
+
+    def render(self, runs=False, atlas=False):
+        # render the line
+        # accepts optionally a flag to render each run of text on the line
+        #   with one font render, rather than rendering each token, and a
+        #   flag to draw text from glyph atlases where it can be
+        # returns Surface object with the tokens justified upon it
+        surf = Surface(self.size)
+        surf.set_colorkey(BLACK)
+        stats = _STATS
+        if stats is not None: stats.surface(surf)
+        if runs: placements = self._runs()
+        else: placements = self._placements
+        for shape, x, y, w in placements:
+            if isinstance(shape, _Run):
+                # runs are drawn straight onto the line
+                if not (atlas and shape.draw(surf, (x, y))):
+                    shape.blit(surf, (x, y))
+                continue
+            if w == shape.get_width():
+                surf.blit(shape.render(atlas), (x, y))
+                continue
+            # stretched whitespace is filled with its background, rather than
+            # rendered and scaled, where it can be
+            fill = shape.get_fill()
+            if fill is not None:
+                surf.fill(fill, (x, y, w, shape.get_height()))
+                continue
+            token_surf = scale(shape.render(atlas), (w, shape.get_height()))
+            if stats is not None: stats.surface(token_surf)
+            surf.blit(token_surf, (x, y))
+        for shape, x, y, w in self._placements: shape.release()
+        return surf
+
+
+    def _runs(self):
+        # merge the text of the line into runs of text pieces that share a
+        # style and abut, so that each run is rendered with one font render.
+        # whitespace stretched by justification
+        # joins a run as text that is not drawn, and is filled as it is
+        # without runs, so that the words of a justified line are cut from
+        # one render.  whitespace that can not be filled and tokens with
+        # surfaces are placed as they are
+        # accepts nothing
+        # returns a list of (shape or run, x, y, width) placements
+        placements, run = [], None
+        for shape, x, y, w in self._placements:
+            pieces = shape.pieces
+            if not all(piece is None or isinstance(piece, basestring)
+                       for (px, h, piece, font, color, bkg) in pieces):
+                placements.append((shape, x, y, w))
+                run = None
+                continue
+
+            height = shape.get_height()
+            if w != shape.get_width(): # stretched whitespace
+                placements.append((shape, x, y, w))
+                if run is None or len(pieces) != 1 or shape.get_fill() is None:
+                    run = None
+                    continue
+                (px, h, piece, font, color, bkg), = pieces
+                if run.joins(x, y + height - h, piece, font, color, bkg):
+                    run.txt += piece
+                    run.size = (run.size[0] + font.size(piece)[0], h)
+                    run.end = (x + w, run.end[1])
+                else: run = None
+                continue
+
+            for (px, h, piece, font, color, bkg) in pieces:
+                if piece is None: continue # newlines are not drawn
+                px, py = x + px, y + height - h
+                piece_w = font.size(piece)[0]
+                if run is not None and run.joins(px, py, piece, font, color,
+                                                 bkg):
+                    slices = run.slices
+                    sx, dx, sw, txt = slices[-1]
+                    if run.x + dx + sw == px: # the piece abuts the slice
+                        slices[-1] = (sx, dx, sw + piece_w, txt + piece)
+                    else: # the piece follows stretched whitespace
+                        slices.append((run.size[0], px - run.x, piece_w, piece))
+                    run.txt += piece
+                    run.size = (run.size[0] + piece_w, h)
+                else:
+                    run = _Run(piece, (piece_w, h), font, color, bkg, px)
+                    placements.append((run, px, py, None))
+                run.end = (px + piece_w, py)
+
+        return [(shape, x, y, shape.get_width()) if w is None
+                else (shape, x, y, w) for (shape, x, y, w) in placements]
+
 
     def __str__(self):
-        return ''.join(str(token) for token in self.line)
+        return str(self.str)
+
+
+
+class _LinkIndex(object):
+    # a uniform grid of link rects, for hit-testing points against the links
+    # on a glyph image without walking every link rect
+    # cell is the width and height of the grid cells
+    # cells is a dictionary of lists of (rect, link) pairs, keyed to the index
+    #   of the grid cell the rects overlap
+    # owners is a dictionary of lists of (cell index, (rect, link)) pairs,
+    #   keyed to the owner the rects were added under
+
+
+    def __init__(self, size, cell=32):
+        # accepts the (width, height) of the glyph image, and the cell size
+        self.cell = cell
+        self.stride = int(size[0]) // cell + 1 # the number of cells in a row
+        self.cells = {}
+        self.owners = {}
+
+
+    def add(self, links, owner=None):
+        # add link rects to the index.  horizontally adjacent rects of the
+        # same link are merged.  rects that are not linked are not added
+        # accepts a dictionary of link id strings keyed to lists of rects, and
+        #   optionally an owner (e.g. a Line) to add the rects under, so that
+        #   they can be removed together
+        # returns nothing
+        cell, stride, cells = self.cell, self.stride, self.cells
+        if owner is None: owned = None
+        else: owned = self.owners.setdefault(owner, [])
+
+        for link, rects in links.items():
+            if link is None: continue
+
+            merged = []
+            for rect in sorted(rects, key=lambda rect: (rect.y, rect.x)):
+                if not rect.w or not rect.h: continue
+                if merged:
+                    last = merged[-1]
+                    if (last.y == rect.y and last.h == rect.h
+                        and last.right == rect.x):
+                        last.w += rect.w
+                        continue
+                merged.append(Rect(rect))
+
+            for rect in merged:
+                entry = (rect, link)
+                x0 = min(max(rect.left // cell, 0), stride - 1)
+                x1 = min(max((rect.right - 1) // cell, 0), stride - 1)
+                for cy in xrange(max(rect.top // cell, 0),
+                                 max((rect.bottom - 1) // cell, 0) + 1):
+                    for cx in xrange(x0, x1 + 1):
+                        key = cy * stride + cx
+                        cells.setdefault(key, []).append(entry)
+                        if owned is not None: owned.append((key, entry))
+
+
+    def remove(self, owner):
+        # remove the link rects added under an owner
+        # accepts the owner
+        # returns nothing
+        cells = self.cells
+        for key, entry in self.owners.pop(owner, ()):
+            cell = cells[key]
+            for i, _entry in enumerate(cell):
+                if _entry is entry:
+                    del cell[i]
+                    break
+
+
+    def get(self, x, y):
+        # get the link at a point
+        # accepts the x and y of a point on the glyph image
+        # returns the link colliding with the point, or None
+        cell = self.cell
+        if x < 0 or y < 0: return None
+        cx = x // cell
+        if cx >= self.stride: return None
+        for rect, link in self.cells.get(y // cell * self.stride + cx, ()):
+            if rect.collidepoint(x, y): return link
+        return None
 
 
 
@@ -282,11 +1256,35 @@ class GlyphGroup(dict):
             if link: return k, link
         return None, None
 
-    def draw(self, surface):
-        for v in self.values(): surface.blit(v.image, v.rect)
+    def draw(self, surface, rects=None):
+        """draw the Glyphs to surface, or only the areas of the Glyphs
+        within rects, a list of rects on surface"""
+        for v in self.values():
+            if rects is None: surface.blit(v.image, v.rect)
+            else:
+                x, y = v.rect.topleft
+                for rect in rects:
+                    rect = rect.clip(v.rect)
+                    if rect: surface.blit(v.image, rect, rect.move(-x, -y))
 
     def update(self):
-        for v in self.values(): v.update()
+        """update the Glyphs in the group, and return the list of areas of
+        the screen they changed, as for Glyph.get_dirty"""
+        dirty = []
+        for v in self.values():
+            v.update()
+            dirty.extend(v.get_dirty())
+        return dirty
+
+    def get_dirty(self):
+        """return the areas of the screen the Glyphs in the group changed"""
+        dirty = []
+        for v in self.values(): dirty.extend(v.get_dirty())
+        return dirty
+
+    def set_cache(self, cache):
+        """share the token cache, cache, between all Glyphs in the group"""
+        for v in self.values(): v.cache = cache
 
 
 class Glyph(object):
@@ -296,13 +1294,20 @@ class Glyph(object):
     rect-- rect for blitting image to viewing surface
     spacing-- line spacing
     links-- dict of (link, [rects]) pairs
+    cache-- LRUCache of rendered words, may be shared between Glyphs
+    runs-- if true, each run of text of one style on a line is rendered with
+      one font render, rather than each word being rendered on its own
+    atlas-- if true, text is drawn from glyph atlases where it can be
+    scroll_y-- the y of the document shown at the top of the image, or None
+      if the glyph has not been scrolled
     """
 
 
     ##################################################################
     # class methods
     def __init__(self, rect, bkg=BLACK, color=WHITE, font=FONT, spacing=0,
-                 ncols=1, col_space=20): # FUTURE COLS ADD
+                 ncols=1, col_space=20, cache=Tokens, runs=False, atlas=False,
+                 instrument=False): # FUTURE COLS ADD
         """
         Initialize a glyph object
 
@@ -312,6 +1317,20 @@ class Glyph(object):
           bkg-- background color
           color-- font color
           font-- font
+        cache-- LRUCache of rendered words; by default the cache is shared by
+          all Glyphs.  None disables caching
+        runs-- if true, render each run of text of one style on a line with
+          one font render, rather than rendering each word and copying it to
+          the line; default is False
+        atlas-- if true, draw text by copying its characters from a glyph
+          atlas of each font, color, and background, built on first use,
+          rather than rendering it.  text with characters outside the atlas,
+          or with characters the font kerns, is rendered; default is False
+        instrument-- if true, or a Stats object to share with other glyphs,
+          time the stages of laying out and drawing text, and count the font
+          renders, surfaces, lines, and cache hits they make.  see the stats
+          and write_trace methods.  an uninstrumented glyph records nothing;
+          default is False
         """
         # initialize
         self.image = Surface(rect.size)
@@ -321,6 +1340,9 @@ class Glyph(object):
         self.rect = rect
         self.spacing = spacing
         self.links = defaultdict(list)
+        self.cache = cache
+        self.runs = runs
+        self.atlas = atlas
         # FUTURE ###
         self.editors = {}
         ############
@@ -331,6 +1353,7 @@ class Glyph(object):
         self.ncols = ncols
         #################
         self._dest = Rect(0, 0, 0, 0) # rect to blit a txt line to image surface
+        self._index = _LinkIndex(rect.size) # spatial index of self.links
         # list of (env_id, value) pairs for environments;
         # _envs is used as a stack data structure
         self._envs = [('bkg', bkg),
@@ -339,159 +1362,601 @@ class Glyph(object):
                       ('link', None)] # link id string
 
         self.buff = deque() # rendered text buffer
+        self._paras = [] # paragraphs input since the glyph was cleared
+        self._placed = [] # lines placed on the image, in order
+        # every line of the document, the y of each line in a single column,
+        # and the number of lines whose y is known
+        self._lines, self._tops, self._stale = [], [], 0
+        self.scroll_y = None
+        self._view = (0, 0) # the slice of self._lines in the view
+        self._dirty = [] # areas of the image changed since get_dirty
+        # true if the image was loaded without the text drawn on it, as by
+        # PageCache, so that no text can be laid out on it
+        self._loaded = False
+        # generators of the paragraphs of streamed input not yet laid out
+        self._streams = deque()
+        # (result, paragraphs, envs, editors) of input_async layouts not yet
+        # added to the glyph
+        self._pending = deque()
+        if instrument is True: instrument = Stats()
+        self._stats = instrument or None # the Stats of the glyph, or None
+        if self._stats is not None: self.__instrument(self._stats)
 
 
     ##################################################################
     # helper methods
-    def __read_env(self, _txt_):
-        # interprets and returns an environment.  environments set text
-        # characteristics such as color or links.
-        # accepts the _txt_ iterable at an environment starting point
+    def __check_text(self):
+        # check that the glyph has the text drawn on its image, so that text
+        # can be laid out on it
+        # raises ValueError if it was loaded without its text
+        if self._loaded:
+            raise ValueError('a glyph loaded without its text can not lay out'
+                             ' text until it is cleared')
+
+
+    def __instrument(self, stats):
+        # time the public methods of the glyph and its stages of work with
+        # stats, by wrapping the bound methods in instance attributes, so
+        # that uninstrumented glyphs call their methods directly
+        # accepts a Stats object
+        # returns nothing
+        if self.cache is not None: stats.watch('tokens', self.cache)
+        stats.watch('compiled', _COMPILED)
+        stats.watch('atlases', Atlases)
+        stages = [(name, name) for name in ('input', 'insert', 'replace',
+                                            'replace_span', 'measure',
+                                            'update', 'scroll_to',
+                                            'scroll_by')]
+        stages += [('_interpret', 'interpret'), ('_Glyph__place', 'draw'),
+                   ('_Glyph__relayout', 'draw'), ('_Glyph__view', 'draw')]
+        for attr, name in stages:
+            setattr(self, attr, _instrumented(stats, name, getattr(self, attr)))
+        self.__paragraphs = self.__staged_paragraphs
+
+
+    def __make_env(self, op, arg, editors, envs):
+        # makes an environment from a compiled environment declaration
+        # accepts an (opcode, argument) pair from a compiled document, the
+        #   dictionary editors are added to, and the environment stack
         # return (environment type, environment) tuple (e.g (font, Font object))
+        if op == _PUSH: return arg
 
-        # re to get env arguments (arguments may be paths and contain \ or /)
-        r = re.compile('(\w+)(\s+((\"|\').*?(\"|\')|.*?))?;')
-        charbuffer = ''
-        # _txt_ is a generator, so iterating consumes the contents for the
-        # references to _txt_ in the _interpret function
-        for i, char in _txt_:
-            charbuffer += char
-            s = r.search(charbuffer) # search for environment name arguments
-            if s: # if search successful
-                groups = s.groups() # get environment
-                env, args = groups[0], groups[2]
-                if env in Macros: return Macros[env]
-                # new environment types must be added here
-
-                elif env == 'bkg':
-                    # return new backgroun color
-                    return ('bkg', tuple([int(e) for e in args.split(',')]))
-
-                elif env == 'color':
-                    # return new font color
-                    return ('color', tuple([int(e) for e in args.split(',')]))
-
-                elif env == 'font':
-                    # return new font
-                    path, size = args.split(',') # the font location and size
-                    return ('font', Font(os.path.realpath(path), int(size)))
-
-                elif env == 'link':
-                    # return new link
-                    return ('link', args.strip())
+        elif op == _FONT:
+            # return new font
+            path, size = arg
+            return ('font', Fonts.load(path, size))
 
+        # FUTURE ###
+        elif op == _EDITOR:
+            #editor is considered an environment because it must be
+            #linked.  any text in an editor environment is input to
+            #that editor, and any nested environments are ignored.
+            name, w = arg
+            #extract editor kw args
+            kw = dict(envs)
+            del kw['link']
+            kw['spacing'] = self.spacing
+            h = kw['font'].get_linesize()
+            editor = Editor(Rect(0, 0, w, h), **kw)
+            editors[name] = editor 
+            # treat as link env, get_collision will sort 
+            return ('link', name)
+        ############
+
+
+    def __call_func(self, (func, args)):
+        # calls a function that loads a resource
+        # accepts a (function type, arguments) pair from a compiled document
+        # returns the function results (eg. Surface object)
+        if func == 'img':
+            path, size = args
+            return Images.load(path, size)
+
+
+    def __link(self, line, offset):
+        # moves the link rects of a line by offset, and adds them to the links
+        # of the glyph
+        # accepts a Line object, and an (x, y) offset
+        # returns nothing
+        links, editors = self.links, self.editors
+        for link in line.links:
+            for _rect in line.links[link]:
+                # move rect to token's pos on image and append to links
+                _rect.move_ip(offset)
+                links[link].append(_rect)
                 # FUTURE ###
-                elif env == 'editor':
-                    #editor is considered an environment because it must be
-                    #linked.  any text in an editor environment is input to
-                    #that editor, and any nested environments are ignored.
-                    name, w = args.split(',')
-                    #extract editor kw args
-                    kw = dict(self._envs)
-                    del kw['link']
-                    kw['spacing'] = self.spacing
-                    h = kw['font'].get_linesize()
-                    editor = Editor(Rect(0, 0, int(w), h), **kw)
-                    self.editors[name] = editor 
-                    # treat as link env, get_collision will sort 
-                    return ('link', name)
+                if link in editors: editors[link].rect = _rect
                 ############
+        self._index.add(line.links, line)
+
+
+    def __unplace(self, line):
+        # returns a placed line to its unplaced state, with its link rects
+        # relative to the line
+        # accepts a Line object
+        # returns nothing
+        x, y = line.pos
+        for rects in line.links.values():
+            for _rect in rects: _rect.move_ip(-x, -y)
+        line.pos = line.col = None
+
+
+    def __place(self, snapshot=None):
+        # draws lines from the buffer to the image until the buffer is empty
+        # or the image is full.  a line that was already placed is copied from
+        # snapshot, an image of the glyph taken before it was laid out again,
+        # rather than rendered again
+        # accepts optionally the snapshot Surface
+        # returns 1 if the buffer was emptied, else 0
+        buff, dest, placed = self.buff, self._dest, self._placed
+        spacing = self.spacing
+        image, rect, dirty = self.image, self.rect, self._dirty
+        editors, link = self.editors, self.__link
+        # FUTURE COLS ###
+        ncols, col_n = self.ncols, self.col_n
+        col_w, col_space = self.col_w, self.col_space
+        #################
 
+        status = 1
+        while buff:
+            line = buff.popleft()
+            line_h = line.get_height()
+            if dest.y + line_h > rect.h:
+                buff.appendleft(line)
+                # FUTURE COLS ###
+                if col_n < ncols:
+                    dest.move_ip(col_w+col_space, -dest.y)
+                    col_n += 1
+                else:
+                    # streamed input is read only until it overflows
+                    if not self._streams: stderr.write(WARN_BUFF)
+                    status = 0
+                    break
+                # break # FUTURE COLS DEL
+                #################
+            else:
+                pos = line.pos
+                if pos is None:
+                    image.blit(line.render(self.runs, self.atlas), dest)
+                    offset = dest.topleft
                 else:
-                    raise ValueError(env + ' is an unrecognized environment')
+                    image.blit(snapshot, dest, Rect(pos, line.get_size()))
+                    offset = (dest.x - pos[0], dest.y - pos[1])
+                line.pos, line.col = dest.topleft, col_n
+                placed.append(line)
+                link(line, offset)
+                dirty.append(Rect(dest.topleft, line.get_size()))
 
+                dest.y += line_h + spacing
 
-    # the space func could take a size and return a surface or rect...
-    # really only need to shift tokens.  surfs do that without requiring tokens
-    # to have rects
-    def __read_func(self, _txt_):
-        # interprets and returns a function.  functions are special surfaces or
-        # objects.
-        # accepts the _txt_ iterable at function starting point
-        # returns (function type, function results) tuple
-        #   (eg. (space, Surface obejct))
-        r = re.compile('(\w+){(.*?)}')
-        i, char = _txt_.next()
+        # FUTURE COLS ###
+        self.col_n = col_n
+        #################
+        if snapshot is not None:
+            # lines left in the buffer can not be copied once snapshot is gone
+            for line in buff:
+                if line.pos is not None: self.__unplace(line)
+        if not status: return 0
+        # FUTURE ###
+        for editor in editors.values():
+            image.blit(editor.image, editor.rect)
+            dirty.append(Rect(editor.rect))
+        ############
+        return 1
 
-        if char in SPECIALS: return 'special', char
-        if char in WHITESPACE: return 'whitespace', WHITESPACE[char]
 
-        charbuff = char
-        for i, char in _txt_:
-            charbuff += char
-            s = r.search(charbuff)
-            if s:
-                func, args = s.groups()
-                if func in Macros: return func, Macros[func]
+    def __relayout(self, i, j, paras):
+        # replaces paragraphs i through j with new paragraphs, and redraws the
+        # lines that change.  if the new lines are as many and as high as the
+        # old lines, they are drawn in place of the old lines; otherwise the
+        # lines from the first changed line on are placed again, and lines
+        # that were already drawn are copied rather than rendered
+        # accepts the slice of self._paras to replace, and a list of Paragraph
+        #   objects
+        # returns nothing
+        placed, buff, image, bkg = self._placed, self.buff, self.image, self._bkg
+        editors, bounds = self.editors, self.image.get_rect()
+
+        old = [line for para in self._paras[i:j] for line in para.lines]
+        new = [line for para in paras for line in para.lines]
+        self._paras[i:j] = paras
+        following = None # the first line after the new paragraphs
+        if i + len(paras) < len(self._paras):
+            following = self._paras[i + len(paras)].lines[0]
+
+        # remove editors that are no longer linked
+        names = set(link for line in old for link in line.links)
+        for line in new: names.difference_update(line.links)
+        for name in names:
+            if name in editors: del editors[name]
+
+        # replace the old lines in the document.  the line offsets below them
+        # only change if the new lines are not as many or as high
+        same = (len(old) == len(new)
+                and all(line.get_height() == _line.get_height()
+                        for line, _line in zip(old, new)))
+        lines = self._lines
+        if old: n = lines.index(old[0])
+        elif following is not None: n = lines.index(following)
+        else: n = len(lines)
+        lines[n:n + len(old)] = new
+        if not same: self._stale = min(self._stale, n)
+
+        if same and all(line.pos is not None for line in old):
+            # draw the new lines in place of the old lines
+            self.__unlink(old)
+            if old: k = placed.index(old[0])
+            else: k = 0
+            for n, (_line, line) in enumerate(zip(old, new), k):
+                # lines of a scrolled view may start above the image.  fill
+                # does not clip rects above the image, it moves them onto it
+                pos = _line.pos
+                area = Rect(pos, _line.get_size()).clip(bounds)
+                image.fill(bkg, area)
+                image.blit(line.render(self.runs, self.atlas), pos)
+                self._dirty.append(area)
+                line.pos, line.col = pos, _line.col
+                placed[n] = line
+                self.__link(line, pos)
+                for link in line.links:
+                    if link in editors:
+                        editor = editors[link]
+                        image.blit(editor.image, editor.rect)
+            return
+
+        if self.scroll_y is not None:
+            # the glyph is scrolled; draw the view again
+            buff.clear()
+            self.__view(min(self.scroll_y, self.__max_scroll()), True)
+            return
+
+        if old and old[0].pos is not None: k = placed.index(old[0])
+        elif following is not None and following.pos is not None:
+            k = placed.index(following)
+        elif following is None and not buff: k = len(placed)
+        else:
+            # no line of the paragraphs has been placed; replace the old lines
+            # in the buffer, which may let the lines at its head fit
+            old = set(old)
+            lines = [line for line in buff if line not in old]
+            if following is None: n = len(lines)
+            else: n = lines.index(following)
+            lines[n:n] = new
+            buff.clear()
+            buff.extend(lines)
+            self.__place()
+            return
+
+        # place the lines again from the first changed line
+        old = set(old)
+        moved = [line for line in placed[k:] if line not in old]
+        if moved:
+            # blitted rather than copied: Surface.copy crashes on images with
+            # per-surface alpha on some 8 bit displays
+            snapshot = Surface(image.get_size(), 0, image)
+            snapshot.blit(image, (0, 0))
+            if _STATS is not None: _STATS.surface(snapshot)
+        else: snapshot = None
+        for line in placed[k:]:
+            area = Rect(line.pos, line.get_size()).clip(bounds)
+            image.fill(bkg, area)
+            self._dirty.append(area)
+        lines = new + moved + [line for line in buff if line not in old]
+        del placed[k:]
+        buff.clear()
+        buff.extend(lines)
 
-                if func == 'space': return func, Surface((int(args), 1))
-                #"if charbuff = 'img'"?
-                if func == 'img': return func, pygame.image.load(args).convert()
+        # reset the link index and the destination rect to the state they
+        # were in after the line before the first changed line was placed
+        self.links = links = defaultdict(list)
+        self._index = index = _LinkIndex(self.rect.size)
+        for line in placed:
+            for link, rects in line.links.items(): links[link].extend(rects)
+            index.add(line.links, line)
+        if placed:
+            line = placed[-1]
+            x, y = line.pos
+            self._dest = Rect(x, y + line.get_height() + self.spacing, 0, 0)
+            self.col_n = line.col
+        else:
+            self._dest = Rect(0, 0, 0, 0)
+            self.col_n = 1
+
+        self.__place(snapshot)
+
+
+    def __unlink(self, lines):
+        # removes the link rects of placed lines from the links of the glyph
+        # accepts a list of Line objects
+        # returns nothing
+        links, index = self.links, self._index
+        for line in lines:
+            index.remove(line)
+            for link, rects in line.links.items():
+                ids = set(id(_rect) for _rect in rects)
+                links[link] = [_rect for _rect in links[link]
+                               if id(_rect) not in ids]
+
+
+    def __get_tops(self):
+        # gets the y of each line of the document laid out in a single column,
+        # computing those that are not known
+        # accepts nothing
+        # returns the list of the y of each line
+        lines, tops, spacing = self._lines, self._tops, self.spacing
+        n = self._stale
+        del tops[n:]
+        if n: y = tops[-1] + lines[n - 1].get_height() + spacing
+        else: y = 0
+        append = tops.append
+        for line in lines[n:]:
+            append(y)
+            y += line.get_height() + spacing
+        self._stale = len(lines)
+        return tops
+
+
+    def __max_scroll(self):
+        # returns the greatest y the view can be scrolled to
+        return max(self.get_document_height() - self.rect.h, 0)
+
+
+    def __view(self, y, redraw=False):
+        # shows the lines of the document that intersect the view from y to
+        # y + self.rect.h on the image.  if the view is scrolled by less than
+        # its height, the image is scrolled and only the exposed strip of the
+        # image is drawn
+        # accepts the y of the view, and whether to draw the whole view
+        # returns nothing
+        lines, tops = self._lines, self.__get_tops()
+        image, bkg, editors = self.image, self._bkg, self.editors
+        dirty = self._dirty
+        w, h = self.rect.size
+        j0 = self._view[1]
+
+        # the slice of lines intersecting the view
+        i = max(bisect_right(tops, y) - 1, 0)
+        j = bisect_left(tops, y + h)
+
+        if self.scroll_y is None: redraw = True
+        else: dy = y - self.scroll_y
+        clip = Rect(0, 0, w, h)
+        if redraw or abs(dy) >= h: draw = xrange(i, j)
+        elif dy:
+            image.scroll(0, -dy)
+            if dy > 0: clip.top = h - dy
+            clip.h = abs(dy)
+            draw = xrange(max(bisect_right(tops, y + clip.top) - 1, 0),
+                          bisect_left(tops, y + clip.bottom))
+        else: draw = xrange(max(i, j0), j) # lines added to the view
+
+        for line in self._placed: self.__unplace(line)
+        self.links = defaultdict(list)
+        self._index = _LinkIndex(self.rect.size)
+        self._placed = placed = lines[i:j]
+        for n, line in enumerate(placed, i):
+            line.pos, line.col = (0, tops[n] - y), 1
+            self.__link(line, line.pos)
+
+        image.set_clip(clip)
+        if redraw or dy:
+            image.fill(bkg)
+            dirty.append(Rect(0, 0, w, h)) # the image is scrolled or redrawn
+        for n in draw:
+            line = lines[n]
+            image.blit(line.render(self.runs, self.atlas), line.pos)
+            dirty.append(Rect(line.pos, line.get_size()))
+        # FUTURE ###
+        for line in placed:
+            for link in line.links:
+                if link in editors:
+                    editor = editors[link]
+                    image.blit(editor.image, editor.rect)
+                    dirty.append(Rect(editor.rect))
+        ############
+        image.set_clip(None)
+
+        self.scroll_y = y
+        self._view = (i, j)
+
+
+    def __pull(self, height):
+        # lays out paragraphs of streamed input until lines height high are
+        # laid out, or the streams end
+        # accepts a height
+        # returns nothing
+        streams, paras = self._streams, self._paras
+        buff, lines, spacing = self.buff, self._lines, self.spacing
+        while streams and height > 0:
+            try: para = next(streams[0], None)
+            except Exception:
+                # a stream that fails is dropped, so that it is not read on
+                streams.popleft()
+                raise
+            if para is None:
+                streams.popleft()
+                continue
+            paras.append(para)
+            buff.extend(para.lines)
+            lines.extend(para.lines)
+            height -= sum(line.get_height() + spacing for line in para.lines)
+
+
+    def __fill(self):
+        # lays out streamed input until it fills the image: the view of a
+        # scrolled glyph, or the columns of the image left to draw
+        # accepts nothing
+        # returns nothing
+        if not self._streams: return
+        rect = self.rect
+        if self.scroll_y is not None:
+            self.__pull(self.scroll_y + rect.h - self.get_document_height())
+            return
+        space = ((rect.h - self._dest.y) + (self.ncols - self.col_n) * rect.h
+                 - sum(line.get_height() + self.spacing for line in self.buff))
+        # pulling one pixel past the space left overflows it, so that the
+        # image is full
+        if space >= 0: self.__pull(space + 1)
+
+
+    def __add(self, paras):
+        # adds laid out paragraphs to the document and the buffer, after
+        # streamed input still to be read
+        # accepts a list of Paragraph objects
+        # returns nothing
+        if self._streams:
+            self._streams.append(iter(paras))
+            self.__fill()
+            return
+        buff, _paras, lines = self.buff, self._paras, self._lines
+        for para in paras:
+            _paras.append(para)
+            buff.extend(para.lines)
+            lines.extend(para.lines)
+
+
+    def __layout(self, txt, justify, envs, editors):
+        # lays out text on the thread of input_async.  the text is interpreted
+        # with the environment stack and editors passed, rather than those of
+        # the glyph, which the main thread may be using, and is not timed by
+        # the stats of an instrumented glyph, which are not shared between
+        # threads
+        # accepts string literal, a justify command, the environment stack,
+        #   and the dictionary editors are added to
+        # returns a list of Paragraph objects
+        interpreted_txt = list(self.__interpret_ops(_compile(txt), editors,
+                                                    envs))
+        return Glyph.__paragraphs(self, interpreted_txt, justify)
+
+
+    def __collect(self, wait=False):
+        # adds the paragraphs of finished input_async layouts to the glyph in
+        # the order they were input, up to the first unfinished layout, or
+        # waiting for every layout if wait is true
+        # accepts optionally the wait flag
+        # returns nothing
+        pending = self._pending
+        while pending:
+            result, out, envs, editors = pending[0]
+            if not (wait or result.ready()): break
+            pending.popleft()
+            result.get() # raises the error of a failed layout
+            self._envs[:] = envs
+            self.editors.update(editors)
+            self.__add(out[0])
+
+
+    def __paragraphs(self, interpreted_txt, justify):
+        # lays out interpreted text as paragraphs
+        # accepts an interpreted text list, and a justify command
+        # returns a list of Paragraph objects
+        tokenize, wrap = self._tokenize, self._wrap
+        return [_Paragraph(txt, justify, list(wrap(tokenize(txt), justify)))
+                for txt in _paragraphs(interpreted_txt)]
+
+
+    def __staged_paragraphs(self, interpreted_txt, justify):
+        # lays out interpreted text as paragraphs, as __paragraphs, but
+        # tokenizes every paragraph before wrapping any, so that each is
+        # timed as a stage of the stats of an instrumented glyph
+        # accepts an interpreted text list, and a justify command
+        # returns a list of Paragraph objects
+        stats, tokenize, wrap = self._stats, self._tokenize, self._wrap
+        txts = list(_paragraphs(interpreted_txt))
+        mark = stats.begin('tokenize')
+        try: tokenized = [list(tokenize(txt)) for txt in txts]
+        finally: stats.end('tokenize', mark)
+        mark = stats.begin('wrap')
+        try:
+            paras = [_Paragraph(txt, justify, list(wrap(tokens, justify)))
+                     for txt, tokens in zip(txts, tokenized)]
+        finally: stats.end('wrap', mark)
+        stats.count('lines', sum(len(para.lines) for para in paras))
+        return paras
 
 
     ##################################################################
     # private methods
-    def _interpret(self, txt):
+    def _interpret(self, txt, editors=None):
         # iterprets glyph markup language
-        # accepts string literal
+        # accepts string literal, and optionally the dictionary editors are
+        #   added to; default is self.editors
         # returns a list of (env, charbuff) pairs,
         #   where env is a dictionary of environment types keyed to values and
         #   charbuff a list of text strings and the surfaces created from
         #   functions
-        editors, envs = self.editors, self._envs
-        read_env, read_func = self.__read_env, self.__read_func
+        if editors is None: editors = self.editors
+        return list(self.__interpret_ops(_compile(txt), editors, self._envs))
+
+
+    def __interpret_ops(self, document, editors, envs, stream=False):
+        # interprets a compiled document
+        # accepts an iterable of (opcode, argument) pairs, as from _compile,
+        #   the dictionary editors are added to, the environment stack, and
+        #   optionally the stream flag.  a streamed document yields its text
+        #   as it is interpreted, cut after whitespace, rather than once each
+        #   environment ends
+        # yields (env, charbuff) pairs, as for _interpret
+        make_env, call_func = self.__make_env, self.__call_func
         iswhitespace = _iswhitespace
 
-        txt = txt.strip()
         # FUTURE ###
         # preamble, txt = read_preamble(txt)
         # if preamble: envs = preamble
         # ##########
 
-        # initialize charbuff, renderbuff, interpreted text, and previous char
-        charbuff, interpreted_txt, prevchar = [], [], ''
-        _txt_ = enumerate(txt)
-        for i, char in _txt_:
-            if iswhitespace(char) and iswhitespace(prevchar):
-                if char == '\n': charbuff[-1] = char
-                continue
-
-            if char == '/': # a function:
-                func, char = read_func(_txt_)
-                charbuff.append(char)
-                prevchar = char
-
-            elif char == '{': # a new environment has started
-                # using dict(envs) allows new environments to overwrite default
-                # environments, which are in the beginning of the list
-                interpreted_txt.append((dict(envs), charbuff))
-                charbuff = []
-                envs.append(read_env(_txt_))
-
-            elif char == '}': # an environment has ended
+        # initialize charbuff
+        charbuff = []
+        for op, arg in document:
+            if op == _CHARS:
+                charbuff.extend(arg)
+                if stream and dict(envs)['link'] not in editors:
+                    # the text of an editor is inserted when it ends
+                    k = len(charbuff)
+                    while k and not iswhitespace(charbuff[k - 1]): k -= 1
+                    if k:
+                        yield (dict(envs), charbuff[:k])
+                        charbuff = charbuff[k:]
+
+            elif op == _CALL: charbuff.append(call_func(arg))
+
+            elif op == _POP: # an environment has ended
                 # FUTURE ###
                 link = dict(envs)['link']
                 if link in editors:
                     editor = editors[link]
-                    # this is a hack to feed char to editor using input method
-                    for char in charbuff:
-                        mod = 0
-                        if char.isupper(): mod = 3
-                        event = Event(KEYDOWN, key=None, mod=mod,
-                                      unicode=char.encode('utf8'))
-                        editor.input(event)
-                    interpreted_txt.append((dict(envs), [editor.image]))
-                else: interpreted_txt.append((dict(envs), charbuff))
-                #interpreted_txt.append((dict(envs), charbuff)) # FUTURE DEL
+                    editor.insert_text(''.join(charbuff))
+                    yield (dict(envs), [editor.image])
+                else: yield (dict(envs), charbuff)
+                #yield (dict(envs), charbuff) # FUTURE DEL
                 ############
                 charbuff = []
                 envs.pop()
 
-            else: # a normal, string, character
-                charbuff.append(char)
-                prevchar = char
-        if charbuff: interpreted_txt.append((dict(envs), charbuff))
-        return interpreted_txt
+            else: # a new environment has started
+                # using dict(envs) allows new environments to overwrite default
+                # environments, which are in the beginning of the list
+                yield (dict(envs), charbuff)
+                charbuff = []
+                envs.append(make_env(op, arg, editors, envs))
+        if charbuff: yield (dict(envs), charbuff)
+
+
+    def _stream(self, source, justify):
+        # lays out input as paragraphs, reading the source only as
+        # paragraphs are taken.  the stream is interpreted with its own
+        # environment stack, which becomes the stack of the glyph once the
+        # stream ends, as though the input had been interpreted at once
+        # accepts a source, as for the input method, and a justify command
+        # yields Paragraph objects
+        envs = list(self._envs)
+        document = (op for ops in _compile_stream(_chunks(source))
+                    for op in ops)
+        interpreted_txt = self.__interpret_ops(document, self.editors, envs,
+                                               True)
+        for txt in _paragraphs(interpreted_txt):
+            for para in self.__paragraphs(txt, justify): yield para
+        self._envs[:] = envs
 
 
     def _tokenize(self, interpreted_txt):
@@ -499,6 +1964,7 @@ class Glyph(object):
         # accepts (envs, charbuff)
         # returns a list of tokens
         iswhitespace, token_builder = _iswhitespace, _token_builder
+        cache = self.cache
 
         charbuff, _interpreted_txt, tokenized_txt = [], [], []
         for (envs, chars) in interpreted_txt:
@@ -509,17 +1975,17 @@ class Glyph(object):
                         charbuff = []
 
                     if _interpreted_txt:
-                        yield token_builder(_interpreted_txt)
+                        yield token_builder(_interpreted_txt, cache)
                         _interpreted_txt = []
 
-                    yield token_builder([(envs, [char])])
+                    yield token_builder([(envs, [char])], cache)
 
                 else: charbuff.append(char)
 
             if charbuff:
                 _interpreted_txt.append((envs, charbuff))
                 charbuff = []
-        if _interpreted_txt: yield token_builder(_interpreted_txt)
+        if _interpreted_txt: yield token_builder(_interpreted_txt, cache)
 
 
     def _wrap(self, tokenized_txt, justify):
@@ -535,7 +2001,7 @@ class Glyph(object):
         # linesize tracks the current size of the rendered line because moving
         # between environments will mean that there will be multiple surfaces
         # that need to be glued together
-        line = [] # initialize line, and linesize
+        line, line_w = [], 0 # initialize line, and linesize
         for token in tokenized_txt:
             token_w = token.get_width()
             if token_w > rect_w:
@@ -547,23 +2013,26 @@ class Glyph(object):
             # rect area, if not, append line without token, reinitialize line
             # with token
             line.append(token)
-            if unicode(token) == '\n':
+            line_w += token_w
+            if token.str == '\n':
                 # don't justify a line that would not wrap
                 if justify == 'justified': _justify = 'left'
                 else: _justify = justify
 
                 yield Line(line, rect_w, _justify)
-                line = [] # reset line
+                line, line_w = [], 0 # reset line
 
-            elif sum(token.get_width() for token in line) > rect_w:
+            elif line_w > rect_w:
                 token = line.pop()
                 # remove single trailing whitespace
                 if line[-1].iswhitespace: line = line[:-1]
 
                 yield Line(line, rect_w, justify)
-                line = [] # reinitialize _line, line, linesize, and num objects
+                line, line_w = [], 0 # reinitialize line and linesize
                 # do not append whitespace as the first token of the new line
-                if not token.iswhitespace: line.append(token)
+                if not token.iswhitespace:
+                    line.append(token)
+                    line_w = token_w
 
         if line:
             # don't justify a line that would not wrap
@@ -577,9 +2046,15 @@ class Glyph(object):
     # public methods
     def input(self, txt, justify=None, update=True):
         """
-        interprets, renders, wraps, and justifies input text
-
-        txt -- raw text written with glyph markup
+        interprets, wraps, and justifies input text.  lines of text are
+        rendered when update draws them to the image
+
+        txt -- raw text written with glyph markup, or a source of it to be
+          streamed: a file-like object with a read method, or an iterable of
+          strings, such as a generator.  streamed input is read and laid out
+          a paragraph at a time, only until it fills the image or the view of
+          a scrolled glyph, and is read on as the glyph is scrolled.  markup
+          may be cut anywhere between the strings of a source
         justify -- a justify command; default is left justified
           left: left justified
           right: right justified
@@ -588,15 +2063,188 @@ class Glyph(object):
 
         returns nothing
         """
-        buff, interpret, tokenize, wrap = (self.buff, self._interpret,
-                                           self._tokenize, self._wrap)
-        interpreted_txt = interpret(txt)
-        tokens = tokenize(interpreted_txt)
-        lines = wrap(tokens, justify)
-        buff.extend(lines)
+        self.__check_text()
+        if self._pending: self.__collect(True)
+        if not isinstance(txt, basestring) or self._streams:
+            # text input while a stream is read follows the stream
+            self._streams.append(self._stream(txt, justify))
+            self.__fill()
+            if update: self.update()
+            return
+
+        self.__add(self.__paragraphs(self._interpret(txt), justify))
         if update: self.update()
 
 
+    def input_async(self, txt, justify=None):
+        """
+        interprets, wraps, and justifies input text on a worker thread, as the
+        input method does, so that the thread calling it is not held up by
+        long text.  the text is added to the glyph and drawn by the first
+        call to update after its layout is finished, so a game loop inputs
+        text with input_async and goes on calling update each frame.  text
+        input by input_async is added in the order it was input, before text
+        input later by input, insert, or replace, which wait for it
+
+        layout runs while the main thread is not running python code, e.g.
+        while it waits in Clock.tick or display.flip.  on the worker thread,
+        text is measured, fonts are opened, images are loaded and converted,
+        and editors are made; nothing is drawn to the image or the display.
+        the main thread must make every other pygame call: display calls
+        such as set_mode, flip, and update, event calls such as get and
+        pump, and drawing, including every Glyph method but input_async.
+        display.set_mode must not be called, and Macros must not be changed,
+        while layouts are running, because images are converted to the
+        display format and macros are read as text is laid out
+
+        txt -- raw text written with glyph markup
+        justify -- a justify command, as for the input method
+
+        returns an AsyncResult, as from multiprocessing.pool: ready() is true
+        once the layout is finished, wait(timeout) waits for it, and get()
+        waits for it and raises the error of a failed layout.  update raises
+        the error of a failed layout too
+        """
+        self.__check_text()
+        # a layout interprets its text with the environment stack and
+        # editors left by the layouts before it
+        if self._pending: envs, editors = self._pending[-1][2:]
+        else: envs, editors = list(self._envs), dict(self.editors)
+        out = []
+        def layout(): out.append(self.__layout(txt, justify, envs, editors))
+        result = _pool().apply_async(layout)
+        self._pending.append((result, out, envs, editors))
+        return result
+
+
+    def insert(self, n, txt, justify=None):
+        """
+        interprets, wraps, and justifies input text, and inserts it before a
+        paragraph of the text already input.  paragraphs are the runs of input
+        text ending at a newline or at the end of an input, numbered from 0 in
+        the order they were input since the glyph was last cleared.  only the
+        new lines are rendered; lines below them are moved on the image
+
+        n-- the number of the paragraph to insert before; the number of
+          paragraphs appends the text
+        txt-- raw text written with glyph markup
+        justify-- a justify command, as for the input method; default is the
+          justify command of the paragraph the text is inserted before, or
+          when appending, of the last paragraph
+
+        returns nothing
+        """
+        self.__check_text()
+        if self._pending: self.__collect(True)
+        if justify is None:
+            paras = self._paras
+            if n < len(paras): justify = paras[n].justify
+            elif paras: justify = paras[-1].justify
+        paras = self.__paragraphs(self._interpret(txt), justify)
+        self.__relayout(n, n, paras)
+
+
+    def replace(self, n, txt, justify=None):
+        """
+        replaces a paragraph of the text already input.  only the lines of the
+        paragraph are laid out and rendered again.  if the new lines are as
+        high as the old lines, the rest of the image is not touched; otherwise
+        lines below them are moved on the image
+
+        n-- the number of the paragraph to replace, as for the insert method
+        txt-- raw text written with glyph markup; it may hold any number of
+          paragraphs, and if empty the paragraph is removed
+        justify-- a justify command, as for the input method; default is the
+          justify command the paragraph was input with
+
+        returns nothing
+        """
+        self.__check_text()
+        if self._pending: self.__collect(True)
+        if justify is None: justify = self._paras[n].justify
+        paras = self.__paragraphs(self._interpret(txt), justify)
+        self.__relayout(n, n + 1, paras)
+
+
+    def replace_span(self, n, start, stop, txt):
+        """
+        replaces a span of the characters of a paragraph of the text already
+        input, as for the replace method.  the new text takes the environments
+        of the first replaced character, or when inserting (start == stop) of
+        the character before start, so that e.g. replacing colored text keeps
+        its color
+
+        n-- the number of the paragraph, as for the insert method
+        start, stop-- the span of characters to replace.  positions count the
+          characters of the text of the paragraph after markup is interpreted,
+          and count each image or other surface as one character
+        txt-- raw text written with glyph markup.  as with all input text,
+          leading and trailing whitespace is stripped
+
+        returns nothing
+        """
+        self.__check_text()
+        if self._pending: self.__collect(True)
+        para = self._paras[n]
+        head, tail = _cut(para.txt, start)
+        # the environments of the first replaced character or, if no
+        # character is replaced, of the character before start
+        runs = [envs for envs, chars in head if chars]
+        if start < stop and tail: envs = tail[0][0]
+        elif runs: envs = runs[-1]
+        elif tail: envs = tail[0][0]
+        else: envs = {}
+        tail = _cut(tail, stop - start)[1]
+
+        # interpret txt within the environments of the text at start
+        _envs = self._envs
+        depth = len(_envs)
+        _envs.extend(envs.items())
+        try: interpreted_txt = self._interpret(txt)
+        finally: del _envs[depth:]
+
+        # join the text, merging neighbouring runs of text in the same
+        # environments so that they are laid out as one run
+        txt = []
+        for envs, chars in head + interpreted_txt + tail:
+            if not chars: continue
+            if txt and txt[-1][0] == envs: txt[-1][1].extend(chars)
+            else: txt.append((envs, list(chars)))
+
+        paras = self.__paragraphs(txt, para.justify)
+        self.__relayout(n, n + 1, paras)
+
+
+    def measure(self, txt, justify=None):
+        """
+        lays out input text without rendering it, or adding it to the buffer.
+        the text is interpreted with a copy of the environment stack, so
+        environments it leaves open do not change text input later.  images
+        of img functions are loaded, to be measured, and are cached as for
+        input
+
+        txt -- raw text written with glyph markup
+        justify -- a justify command, as for the input method
+
+        returns ((width, height), n), where width is the width of the widest
+          line of text, height is the height of the lines of text laid out in
+          a single column, including spacing, and n is the number of lines
+        """
+        spacing = self.spacing
+        interpreted_txt = list(self.__interpret_ops(_compile(txt), {},
+                                                    list(self._envs)))
+        lines = self._wrap(self._tokenize(interpreted_txt), justify)
+
+        width, height, n = 0, -spacing, 0
+        for line in lines:
+            width = max(width, line.text_w)
+            height += line.get_height() + spacing
+            n += 1
+        if not n: height = 0
+
+        return (width, height), n
+
+
     def overwrite(self, txt, **kw):
         self.clear()
         self.input(txt, **kw)
@@ -605,58 +2253,66 @@ class Glyph(object):
     def update(self):
         """
         updates the surface with the text input to the buffer by the input
-        method, then deletes buffer
+        method, then deletes buffer.  a scrolled glyph draws the lines of the
+        buffer that are in view, and keeps the rest in its document
 
         accepts nothing
 
-        returns nothing
+        returns 1 if the buffer was emptied, 0 if the image is full
         """
-        buff, dest = self.buff, self._dest
-        spacing = self.spacing
-        image, rect = self.image, self.rect
-        editors, links = self.editors, self.links
-        # FUTURE COLS ###
-        ncols, col_n = self.ncols, self.col_n
-        col_w, col_space = self.col_w, self.col_space
-        #################
+        if self._pending: self.__collect()
+        if self.scroll_y is None: return self.__place()
+        self.buff.clear()
+        self.__view(self.scroll_y)
+        return 1
 
-        while buff:
-            line = buff.popleft()
-            line_h = line.get_height()
-            if dest.y + line_h > rect.h:
-                buff.appendleft(line)
-                # FUTURE COLS ###
-                if col_n < ncols:
-                    dest.move_ip(col_w+col_space, -dest.y)
-                    col_n += 1
-                else:
-                    stderr.write(WARN_BUFF)
-                    return 0
-                # break # FUTURE COLS DEL
-                #################
-            else:
-                image.blit(line, dest)
 
-                for link in line.links:
-                    for _rect in line.links[link]:
-                        # move rect to token's pos on image and append to links
-                        _rect.move_ip(dest.topleft) # FUTURE ADD
-                        # FUTURE DEL
-                        #links[link].append(_rect.move(dest.topleft))
-                        links[link].append(_rect)
-                        # FUTURE ###
-                        if link in editors: editors[link].rect = _rect
-                        ############
+    def scroll_to(self, y):
+        """
+        scrolls the image to show the document from y.  the lines of the
+        document are kept laid out but not rendered; only lines coming into
+        view are rendered.  once scrolled, input text is added to the document
+        rather than stopping when the image is full.  scrolling requires a
+        single column
 
-                dest.y += line_h + spacing
+        y-- the y of the document to show at the top of the image; it is
+          limited to the height of the document
 
-        # FUTURE ###
-        for editor in editors.values(): image.blit(editor.image, editor.rect)
-        ############
-        # FUTURE COLS ###
-        self.col_n = col_n
-        #################
-        return 1
+        returns the y scrolled to
+        """
+        if self.ncols != 1:
+            raise ValueError('a glyph with more than one column can not be'
+                             ' scrolled')
+        self.__check_text()
+        self.buff.clear()
+        if self._streams:
+            self.__pull(int(y) + self.rect.h - self.get_document_height())
+        y = min(max(int(y), 0), self.__max_scroll())
+        self.__view(y)
+        return y
+
+
+    def scroll_by(self, dy):
+        """
+        scrolls the image by dy, as for the scroll_to method
+
+        dy-- the distance to scroll; positive values scroll towards the end
+          of the document
+
+        returns the y scrolled to
+        """
+        return self.scroll_to((self.scroll_y or 0) + dy)
+
+
+    def get_document_height(self):
+        """
+        returns the height of all of the lines of text input, laid out in a
+          single column, including spacing.  streamed input is counted as far
+          as it has been read
+        """
+        lines = self._lines
+        if not lines: return 0
+        return self.__get_tops()[-1] + lines[-1].get_height()
 
 
     def clear(self, *a):
@@ -672,17 +2328,73 @@ class Glyph(object):
         # reset glyph
         self._dest = Rect(0, 0, 0, 0)
         self.links = defaultdict(list)
+        self._index = _LinkIndex(self.rect.size)
         self.col_n = 1
         self.buff = deque()
+        self._paras = []
+        self._placed = []
+        self._lines, self._tops, self._stale = [], [], 0
+        self.scroll_y = None
+        self._view = (0, 0)
+        self._streams = deque()
+        self._pending = deque()
+        self._loaded = False
         rect = self.rect
         self.image = Surface(rect.size)
         self.image.fill(self._bkg)
+        self._dirty = [self.image.get_rect()]
         # if provided, clear a surface at glyph rect
         if a:
             surface_dest, background = a
             surface_dest.blit(background, rect, rect)
 
 
+    def get_dirty(self):
+        """
+        get the areas of the image changed by input, update, clear, scrolling
+        or editors since get_dirty was last called, so that only those areas
+        need be drawn, e.g. with display.update(rects)
+
+        returns a list of rects on the viewing surface, offset by self.rect
+        """
+        dirty, self._dirty = self._dirty, []
+        bounds = self.image.get_rect()
+        x, y = self.rect.topleft
+        return [rect.clip(bounds).move(x, y) for rect in _coalesce(dirty)
+                if rect.colliderect(bounds)]
+
+
+    def stats(self):
+        """
+        get the stage timings and counters of an instrumented glyph.  stages
+        are the public methods of the glyph, and the interpret, tokenize,
+        wrap, and draw stages of its work.  counters are font_renders,
+        surfaces and the pixels in them, lines laid out, atlas_cells
+        rendered, and the hits and misses of the token cache, the compiled
+        document cache, and the glyph atlases
+
+        returns a dictionary with a 'stages' dictionary of {'calls', 'ms'}
+        dictionaries keyed to stage names, and a 'counts' dictionary of
+        counts keyed to counter names, or None if the glyph is not
+        instrumented
+        """
+        if self._stats is None: return None
+        return self._stats.report()
+
+
+    def write_trace(self, f):
+        """
+        write the stages of an instrumented glyph as a Chrome trace event
+        file, to be opened with chrome://tracing or Perfetto.  the last
+        stages recorded are kept, as for Stats
+
+        f-- a path or a file object
+        """
+        if self._stats is None:
+            raise ValueError('a glyph must be instrumented to write a trace')
+        self._stats.write_trace(f)
+
+
     def get_collisions(self, mpos):
         """
         get collisions between a point and the linked text on the glyph surface
@@ -694,22 +2406,135 @@ class Glyph(object):
         if no link collides with mpos
           returns None
         """
-        editors, links, rect = self.editors, self.links, self.rect
-        for link in links:
-            for _rect in links[link]:
-                if _rect.move(rect.topleft).collidepoint(mpos): return link
+        x, y = mpos
+        rect = self.rect
+        return self._index.get(x - rect.x, y - rect.y)
 
 
 
-"""
-    def scroll(self):
-    # scrolls the surface and destination rect to accomodate text in the buffer
-    # before updating
-    # accepts nothing
-    # returns nothing
-        dest, image, spacing = self._dest, self.image, self.spacing
-        h = sum(line.get_height() + spacing for line in self.buffer)
-        dest.move_ip(0, -h)
-        image.scroll(0, -h)
-        update()
-"""
+
+class Paginator(object):
+    """
+    lays out one document as a sequence of pages, each a Glyph of the rect
+    holding the text that fills its columns, with the image and links of the
+    page.  pages are made as they are asked for: the document is laid out
+    only as far as the pages asked for, and a page is drawn only when it is
+    asked for, so asking for page n lays out the lines of the pages before it
+    to find where page n begins, but draws none of them.  the lines where
+    pages begin are kept as they are found, and the last pages drawn are
+    kept, so that pages already asked for are quick to get again
+
+    paginator[n]-- page n, counting from 0; negative n count from the end
+    len(paginator)-- the number of pages, laying out the whole document
+    iter(paginator)-- the pages in order, each made as it is reached
+
+    keep-- the number of drawn pages kept
+    """
+
+
+    def __init__(self, txt, rect, justify=None, keep=8, **kwargs):
+        """
+        Initialize a paginator
+
+        txt-- raw text written with glyph markup, or a source of it to be
+          streamed, as for the Glyph input method
+        rect-- rect object for positioning the page images on viewing surface
+        justify-- a justify command, as for the Glyph input method
+        keep-- the number of drawn pages kept; default is 8
+        **kwargs-- keyword arguments the pages are initialized with, as for
+          Glyph
+        """
+        self.rect = rect
+        self.keep = keep
+        self._kwargs = kwargs
+        # the glyph the document is laid out by, which is never drawn
+        glyph = Glyph(Rect(rect), **kwargs)
+        self._editors = glyph.editors
+        self._spacing, self._ncols = glyph.spacing, glyph.ncols
+        self._paras = glyph._stream(txt, justify) # paragraphs not yet taken
+        self._lines = [] # the lines laid out so far
+        self._breaks = [0] # the index of the first line of each page found
+        self._pages = LRUCache(keep) # drawn pages keyed by page number
+
+
+    def __len__(self):
+        while self.__find(len(self._breaks)): pass
+        return len(self._breaks) - 1
+
+
+    def __getitem__(self, n):
+        if n < 0: n += len(self)
+        if n < 0 or not self.__find(n + 1):
+            raise IndexError('page index out of range')
+        page = self._pages.get(n)
+        if page is None: page = self._pages.put(n, self.__draw(n))
+        return page
+
+
+    def __iter__(self):
+        n = 0
+        while self.__find(n + 1):
+            yield self[n]
+            n += 1
+
+
+    ##################################################################
+    # helper methods
+    def __line(self, i):
+        # get line i of the document, laying out paragraphs until it is laid
+        # out
+        # accepts a line index
+        # returns a Line object, or None if the document has fewer lines
+        lines = self._lines
+        while len(lines) <= i:
+            para = next(self._paras, None)
+            if para is None: return None
+            lines.extend(para.lines)
+        return lines[i]
+
+
+    def __find(self, n):
+        # find where the first n pages begin and end, by placing lines in
+        # columns as the update method of Glyph does, without drawing them
+        # accepts a number of pages
+        # returns true if the document has at least n pages, else false
+        breaks, line = self._breaks, self.__line
+        h, spacing, ncols = self.rect.h, self._spacing, self._ncols
+        while len(breaks) <= n:
+            i = breaks[-1]
+            if line(i) is None: return False
+            y, col_n = 0, 1
+            while True:
+                _line = line(i)
+                if _line is None: break
+                line_h = _line.get_height()
+                if y + line_h <= h:
+                    y += line_h + spacing
+                    i += 1
+                elif col_n < ncols:
+                    y, col_n = 0, col_n + 1
+                else: break
+            if i == breaks[-1]:
+                raise ValueError('line %d is too high to fit in the rect passed'
+                                 % i)
+            breaks.append(i)
+        return True
+
+
+    def __draw(self, n):
+        # draw page n
+        # accepts a page number of a page found
+        # returns a Glyph object
+        # a page places copies of its lines, so that its link rects are its
+        # own, and are not moved when the page is dropped from the kept pages
+        # and drawn again while it is still held
+        lines = [line.copy()
+                 for line in self._lines[self._breaks[n]:self._breaks[n + 1]]]
+        page = Glyph(Rect(self.rect), **self._kwargs)
+        editors = self._editors
+        for line in lines:
+            for link in line.links:
+                if link in editors: page.editors[link] = editors[link]
+        page.buff.extend(lines)
+        page.update()
+        return page
@@ -0,0 +1,255 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+
+
+
+from hashlib import sha1
+import json
+import mmap
+import os
+import struct
+
+from pygame import Rect, Surface
+from pygame.font import Font
+from pygame.image import frombuffer, tostring
+
+from .cache import LRUCache
+from .editor import Editor
+from .glyph import Glyph, Macros
+
+
+
+
+######################################################################
+# constants
+# a page file is a header, the RGBX pixels of the glyph image, and the rest
+# of the page as JSON.  the header is the magic string, the width and height
+# of the image, and the length of the JSON
+MAGIC = 'GLYPHPG2'
+HEADER = struct.Struct('<8sIII')
+# the text fonts are fingerprinted by drawing
+SAMPLE = ''.join(chr(i) for i in xrange(32, 127))
+# keyword arguments that do not change how a page is drawn
+UNKEYED = frozenset(['cache', 'instrument'])
+
+
+
+
+######################################################################
+# globals
+_FONTS = LRUCache(64) # font fingerprints keyed by font
+_MACROS = {} # the fingerprint of Macros, keyed by Macros.version
+
+
+
+
+######################################################################
+# private functions
+def _fingerprint(value):
+    # get a string identifying a value the same way in every process
+    # accepts a color, font, surface, number, string, None, or tuple or list
+    #   of these.  other values, whose repr may differ between processes,
+    #   raise TypeError
+    # returns a string
+    if isinstance(value, tuple):
+        return '(%s)' % ','.join(_fingerprint(v) for v in value)
+
+    elif isinstance(value, list):
+        return '[%s]' % ','.join(_fingerprint(v) for v in value)
+
+    elif isinstance(value, Font):
+        fingerprint = _FONTS.get(value)
+        if fingerprint is None:
+            # fonts do not know their file, so they are known by their
+            # metrics and by how they draw every printable character
+            sample = value.render(SAMPLE, 1, (255, 255, 255), (0, 0, 0))
+            metrics = (value.get_height(), value.get_ascent(),
+                       value.get_descent(), value.get_linesize(),
+                       value.get_bold(), value.get_italic(),
+                       value.get_underline(), sample.get_size())
+            fingerprint = 'Font(%r,%s)' % (
+                metrics, sha1(tostring(sample, 'RGB')).hexdigest())
+            _FONTS.put(value, fingerprint)
+        return fingerprint
+
+    elif isinstance(value, Surface):
+        return 'Surface(%r,%s)' % (value.get_size(),
+                                   sha1(tostring(value, 'RGBA')).hexdigest())
+
+    elif value is None or isinstance(value, (basestring, int, long, float)):
+        return repr(value)
+
+    raise TypeError('%r can not be keyed the same way by every process'
+                    % (value,))
+
+
+def _str(s):
+    # get a string read from JSON, which reads every string as unicode, as
+    # the str it was written from if it is ascii
+    # accepts a string or None
+    # returns a string or None
+    if isinstance(s, unicode):
+        try: return str(s)
+        except UnicodeEncodeError: pass
+    return s
+
+
+def _macros():
+    # get the fingerprint of the macros, fingerprinting them once for each
+    # version of Macros
+    # accepts nothing
+    # returns a string
+    version = Macros.version
+    if version not in _MACROS:
+        _MACROS.clear()
+        _MACROS[version] = _fingerprint(tuple(
+            (k, Macros[k]) for k in sorted(Macros)))
+    return _MACROS[version]
+
+
+
+
+######################################################################
+# public classes
+class PageCache(object):
+    """
+    a cache of rendered glyphs kept in files, so that static pages rendered by
+    one run of a program are loaded by the next without being interpreted,
+    wrapped, or rendered.  a page file holds the pixels of the glyph image as
+    they are drawn, and is memory mapped when it is loaded, so the image is
+    not copied or decoded.  pages are keyed by their markup, justify command,
+    rect size, the keyword arguments of the glyph, and the fonts and macros
+    they use.  files loaded by the markup, such as images and font files, are
+    keyed by their path only
+
+    path-- the directory the page files are kept in
+    hits-- the number of load calls that found a page file
+    misses-- the number of load calls that rendered the page
+    """
+
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(path): os.makedirs(path)
+
+
+    def key(self, txt, rect, justify=None, **kwargs):
+        """
+        get the key of a page
+
+        txt, rect, justify, and kwargs are as for the load method.  the cache
+        and instrument keyword arguments do not change the page, and are not
+        keyed
+
+        returns the key as a hex string.  keyword arguments and macros that
+        can not be keyed the same way by every process, such as objects
+        without a value of their own, raise TypeError
+        """
+        kwargs = tuple((k, v) for k, v in sorted(kwargs.items())
+                       if k not in UNKEYED)
+        return sha1(MAGIC + _fingerprint((txt, justify, rect.size, kwargs))
+                    + _macros()).hexdigest()
+
+
+    def load(self, txt, rect, justify=None, **kwargs):
+        """
+        get a glyph with txt rendered to its image, loading it from its page
+        file, or rendering it and writing the page file if it has none
+
+        txt-- raw text written with glyph markup
+        rect-- rect object for positioning the glyph image on viewing surface
+        justify-- a justify command, as for the Glyph input method
+        **kwargs-- keyword arguments the glyph is initialized with, as for
+          Glyph
+
+        returns a Glyph object.  a loaded glyph has the image, links, and
+        editors of the rendered glyph, but not its text, so it is drawn but
+        methods that lay out text, such as input, insert, replace, and
+        scroll_to, raise ValueError until the glyph is cleared
+        """
+        path = os.path.join(self.path, self.key(txt, rect, justify, **kwargs)
+                            + '.page')
+        if os.path.exists(path):
+            self.hits += 1
+            return self.__read(path, rect, kwargs)
+
+        self.misses += 1
+        glyph = Glyph(Rect(rect), **kwargs)
+        glyph.input(txt, justify)
+        self.__write(path, glyph)
+        return glyph
+
+
+    def clear(self):
+        """remove every page file in the cache and reset the hit and miss counts"""
+        for name in os.listdir(self.path):
+            if name.endswith('.page'): os.remove(os.path.join(self.path, name))
+        self.hits = self.misses = 0
+
+
+    ##################################################################
+    # private methods
+    def __write(self, path, glyph):
+        # write a glyph to a page file.  a glyph with editors styled unlike
+        # the glyph is not written, because its editors cannot be remade
+        # accepts the path of the page file and a glyph
+        # returns nothing
+        envs = dict(glyph._envs)
+        style = (envs['bkg'], envs['color'], envs['font'], glyph.spacing)
+        editors = []
+        for name, editor in glyph.editors.items():
+            if (editor.bkg, editor.color, editor.font,
+                editor.spacing) != style: return
+            editors.append((name, tuple(editor.rect), editor.get_text()))
+
+        # links are kept as (link, rects) pairs, since JSON keys are strings
+        # and the unlinked text is keyed by None
+        page = {'links': [(link, [tuple(r) for r in rects])
+                          for link, rects in glyph.links.items()],
+                'dirty': [tuple(r) for r in glyph._dirty],
+                'editors': editors}
+        page = json.dumps(page)
+        w, h = glyph.image.get_size()
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, w, h, len(page)))
+            f.write(tostring(glyph.image, 'RGBX'))
+            f.write(page)
+        os.rename(tmp, path)
+
+
+    def __read(self, path, rect, kwargs):
+        # read a glyph from a page file
+        # accepts the path of the page file, the rect of the glyph, and the
+        #   keyword arguments it is initialized with
+        # returns a Glyph object
+        with open(path, 'rb') as f:
+            # a copy on write map, so that drawing to the glyph image does not
+            # change the page file
+            buff = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, w, h, n = HEADER.unpack_from(buff)
+        if magic != MAGIC: raise ValueError(path + ' is not a page file')
+        offset = HEADER.size + w * h * 4
+
+        glyph = Glyph(Rect(rect), **kwargs)
+        image = frombuffer(buffer(buff, HEADER.size, w * h * 4), (w, h),
+                           'RGBX')
+        image.set_alpha(255)
+        glyph.image = image
+        glyph._loaded = True
+        page = json.loads(buff[offset:offset + n])
+        for link, rects in page['links']:
+            glyph.links[_str(link)] = [Rect(r) for r in rects]
+        glyph._index.add(glyph.links)
+        glyph._dirty = [Rect(r) for r in page['dirty']]
+
+        envs = dict(glyph._envs)
+        for name, _rect, txt in page['editors']:
+            editor = Editor(Rect(_rect), bkg=envs['bkg'], color=envs['color'],
+                            font=envs['font'], spacing=glyph.spacing)
+            editor.insert_text(_str(txt))
+            glyph.editors[_str(name)] = editor
+        return glyph
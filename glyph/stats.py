@@ -0,0 +1,140 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+
+
+
+from collections import defaultdict, deque
+import json
+import os
+import thread
+import time
+
+
+
+
+######################################################################
+# public classes
+class Stats(object):
+    """
+    the stage timings and counters of instrumented glyphs.  a stage is a
+    named span of work, such as interpreting markup or drawing lines, and
+    stages may nest.  counters count the font renders, surfaces, and lines
+    made during stages, and the hits and misses of the caches the stats
+    watch while stages run
+
+    stages-- dictionary of [calls, seconds] lists keyed to stage names.  the
+      seconds of a stage nested in a stage of the same name are not counted
+      twice
+    counts-- dictionary of counts keyed to counter names
+    events-- deque of the Chrome trace events of the last maxevents stages
+    """
+
+
+    def __init__(self, maxevents=10000):
+        self.stages = defaultdict(lambda: [0, 0.0])
+        self.counts = defaultdict(int)
+        self.events = deque(maxlen=maxevents)
+        self._caches = {} # caches keyed to the names they are counted under
+        self._open = defaultdict(int) # the depth of each running stage
+        self._depth = 0 # the number of running stages
+        self._hits = None # (hits, misses) of the caches, as stages began
+
+
+    def watch(self, name, cache):
+        """
+        count the hits and misses of an LRUCache while stages run, as the
+        name_hits and name_misses counters.  a cache is counted under one
+        name; watching a cache again replaces its name
+        """
+        self._caches[cache] = name
+
+
+    def count(self, name, n=1):
+        """add n to the counter name"""
+        self.counts[name] += n
+
+
+    def surface(self, surf):
+        """
+        count a surface made, and its pixels
+
+        returns surf
+        """
+        counts = self.counts
+        counts['surfaces'] += 1
+        counts['pixels'] += surf.get_width() * surf.get_height()
+        return surf
+
+
+    def begin(self, name):
+        """
+        begin a stage
+
+        returns the stage mark passed to end
+        """
+        if not self._depth:
+            self._hits = [(cache, cache.hits, cache.misses)
+                          for cache in self._caches]
+        self._depth += 1
+        self._open[name] += 1
+        return (time.time(), dict(self.counts))
+
+
+    def end(self, name, mark):
+        """end a stage begun with begin, given the mark begin returned"""
+        t0, counts0 = mark
+        t = time.time()
+        self._open[name] -= 1
+        self._depth -= 1
+        counts = self.counts
+        if not self._depth:
+            names = self._caches
+            for cache, hits, misses in self._hits:
+                counts[names[cache] + '_hits'] += cache.hits - hits
+                counts[names[cache] + '_misses'] += cache.misses - misses
+
+        stage = self.stages[name]
+        stage[0] += 1
+        if not self._open[name]: stage[1] += t - t0
+        args = dict((k, v - counts0.get(k, 0)) for k, v in counts.iteritems()
+                    if v != counts0.get(k, 0))
+        self.events.append({'name': name, 'cat': 'glyph', 'ph': 'X',
+                            'ts': t0 * 1e6, 'dur': (t - t0) * 1e6,
+                            'pid': os.getpid(), 'tid': thread.get_ident(),
+                            'args': args})
+
+
+    def report(self):
+        """
+        get the stage timings and counters
+
+        returns a dictionary with a 'stages' dictionary of {'calls', 'ms'}
+        dictionaries keyed to stage names, and a 'counts' dictionary of
+        counts keyed to counter names
+        """
+        return {'stages': dict((name, {'calls': calls, 'ms': seconds * 1e3})
+                               for name, (calls, seconds)
+                               in self.stages.iteritems()),
+                'counts': dict(self.counts)}
+
+
+    def write_trace(self, f):
+        """
+        write the recorded stages as a Chrome trace event file, which can be
+        opened with chrome://tracing or Perfetto.  each stage is a complete
+        event, with the counters it changed as its args
+
+        f-- a path or a file object
+        """
+        trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+        if isinstance(f, basestring):
+            with open(f, 'w') as f: json.dump(trace, f)
+        else: json.dump(trace, f)
+
+
+    def reset(self):
+        """discard the recorded timings, counters, and events"""
+        self.stages.clear()
+        self.counts.clear()
+        self.events.clear()
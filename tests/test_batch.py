@@ -0,0 +1,105 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+tests of render_many
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+from pygame.font import Font
+from pygame.image import tostring
+
+from glyph import Glyph, Macros, batch, render_many
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+RESOURCES = os.path.join(os.path.dirname(__file__), os.pardir, 'examples',
+                         'resources')
+SILKSCREEN = os.path.join(RESOURCES, 'font', 'silkscreen.ttf')
+
+
+
+WHITE = (255, 255, 255)
+DOCS = ['a {red; red} word and {link a; a link}',
+        'a second page/nwith two lines',
+        'and a {link b; third}',
+        'an {editor name, 60; editor} and a {big; {editor big, 60; big one}}',
+        'a {font %s, 10; {editor pooled, 60; pooled}} editor' % SILKSCREEN]
+
+
+
+class RenderManyTest(unittest.TestCase):
+
+
+    def setUp(self):
+        Macros['red'] = ('color', (255, 0, 0))
+        Macros['big'] = ('font', Font(None, 20))
+
+
+    def tearDown(self):
+        del Macros['red'], Macros['big']
+
+
+    def check(self, glyphs):
+        # the glyphs are drawn as Glyph.input draws the documents
+        self.assertEqual(len(glyphs), len(DOCS))
+        for glyph, txt in zip(glyphs, DOCS):
+            expected = Glyph(Rect(0, 0, 200, 40))
+            expected.input(txt)
+            self.assertEqual(tostring(glyph.image, 'RGB'),
+                             tostring(expected.image, 'RGB'))
+            self.assertEqual(
+                dict((k, [tuple(r) for r in v])
+                     for k, v in glyph.links.items() if v),
+                dict((k, [tuple(r) for r in v])
+                     for k, v in expected.links.items() if v))
+            self.assertEqual(glyph.get_dirty(), [glyph.rect])
+            self.assertEqual(sorted(glyph.editors), sorted(expected.editors))
+            for name, editor in glyph.editors.items():
+                _editor = expected.editors[name]
+                self.assertEqual(editor.get_text(), _editor.get_text())
+                self.assertEqual(editor.rect, _editor.rect)
+                self.assertEqual(tostring(editor.font.render('Ag', 1, WHITE),
+                                          'RGBA'),
+                                 tostring(_editor.font.render('Ag', 1, WHITE),
+                                          'RGBA'))
+            self.assertRaises(ValueError, glyph.input, 'more')
+
+
+    def test_serial(self):
+        self.check(render_many(DOCS, Rect(0, 0, 200, 40), workers=1))
+
+
+    def test_workers(self):
+        self.check(render_many(DOCS, Rect(0, 0, 200, 40), workers=2))
+
+
+    def test_no_fork_falls_back_to_serial(self):
+        # without fork, documents are rendered in the calling process, and
+        # no pool is started
+        def pool(*args, **kwargs):
+            raise AssertionError('a pool was started without fork')
+        fork, Pool = getattr(os, 'fork', None), batch.Pool
+        if fork is not None: del os.fork
+        batch.Pool = pool
+        try: glyphs = render_many(DOCS, Rect(0, 0, 200, 40), workers=4)
+        finally:
+            if fork is not None: os.fork = fork
+            batch.Pool = Pool
+        self.check(glyphs)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+tests of Editor
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+from pygame.event import Event
+from pygame.font import Font
+from pygame.image import tostring
+from pygame.locals import *
+
+from glyph import Editor
+from glyph.editor import _GapBuffer
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+TXT = ('the quick brown fox jumps over the lazy dog\nAVATAR Wavy jigs, '
+       'fill it.\n\nmore  text to wrap on to the lines below it')
+
+
+
+def _editor(txt=TXT, w=120, font=None):
+    # an editor with txt inserted
+    if font is None: font = Font(None, 16)
+    editor = Editor(Rect(0, 0, w, 200), font=font)
+    editor.insert_text(txt)
+    return editor
+
+
+
+def _key(char):
+    # the KEYDOWN event typing a character: a newline, a backspace (\b), an
+    # arrow key (U, D, L, or R), or another character
+    if char == '\n': return Event(KEYDOWN, key=K_RETURN, mod=0, unicode='\r')
+    if char == '\b': return Event(KEYDOWN, key=K_BACKSPACE, mod=0, unicode='')
+    if char in 'UDLR':
+        key = {'U': K_UP, 'D': K_DOWN, 'L': K_LEFT, 'R': K_RIGHT}[char]
+        return Event(KEYDOWN, key=key, mod=0, unicode='')
+    return Event(KEYDOWN, key=K_a, mod=0, unicode=char)
+
+
+
+class GapBufferTest(unittest.TestCase):
+
+
+    def test_edits(self):
+        # a gap buffer reads as the string it would be after the same edits
+        rnd = random.Random(11)
+        buff, txt = _GapBuffer('start'), 'start'
+        for n in xrange(500):
+            i = rnd.randint(0, len(txt))
+            if rnd.random() < 0.6:
+                s = 'x' * rnd.randint(1, 100) if n % 50 == 0 else 'ab'
+                buff.insert(i, s)
+                txt = txt[:i] + s + txt[i:]
+            elif txt:
+                j = min(i + rnd.randint(0, 3), len(txt))
+                buff.delete(i, j)
+                txt = txt[:i] + txt[j:]
+            self.assertEqual(len(buff), len(txt))
+            self.assertEqual(buff.get_text(), txt)
+            a, b = sorted([rnd.randint(-2, len(txt) + 2) for m in xrange(2)])
+            self.assertEqual(buff[a:b], txt[a:b])
+            if txt: self.assertEqual(buff[i % len(txt)], txt[i % len(txt)])
+        self.assertRaises(IndexError, buff.__getitem__, len(txt))
+
+
+    def test_typing(self):
+        # the text of an editor is the text typed, with the cursor moved left
+        # and right, as the text of a string edited the same way
+        rnd = random.Random(5)
+        editor, txt, k = _editor(''), '', 0
+        for n in xrange(400):
+            char = rnd.choice('abc  \n\bLR')
+            editor.input(_key(char))
+            if char == 'L': k = max(k - 1, 0)
+            elif char == 'R': k = min(k + 1, len(txt))
+            elif char == '\b':
+                if k: txt, k = txt[:k - 1] + txt[k:], k - 1
+            else: txt, k = txt[:k] + char + txt[k:], k + 1
+            self.assertEqual(editor.get_text(), txt)
+            self.assertEqual(editor._cursor, k)
+
+
+
+class _Relayout(Editor):
+    # an editor that lays out all of its text on every edit
+
+
+    def _update(self, i, end=None, d=0):
+        Editor._update(self, 0)
+
+
+
+def _state(editor):
+    # the layout and image of an editor, to compare editors by
+    return (editor._cursor, list(editor._wraps),
+            [(tuple(line.rect), tostring(line.image, 'RGB'))
+             for line in editor._lines],
+            tostring(editor.image, 'RGB'))
+
+
+
+class RewrapTest(unittest.TestCase):
+
+
+    def test_rewrap_stops_where_lines_converge(self):
+        # an editor that stops laying out lines once they start where the old
+        # lines started lays them out as an editor laying out all its text
+        rnd = random.Random(13)
+        for w in (60, 120):
+            font = Font(None, 16)
+            editor = Editor(Rect(0, 0, w, 300), font=font, spacing=2)
+            relayout = _Relayout(Rect(0, 0, w, 300), font=font, spacing=2)
+            for n in xrange(300):
+                r = rnd.random()
+                if r < 0.05: char = '\n'
+                elif r < 0.12: char = '\b'
+                elif r < 0.22: char = rnd.choice('UDLR')
+                else: char = rnd.choice('abcdefghij  ')
+                editor.input(_key(char))
+                relayout.input(_key(char))
+                self.assertTrue(_state(editor) == _state(relayout),
+                                'layouts differ after %d keys' % (n + 1))
+
+
+
+class BulkInputTest(unittest.TestCase):
+
+
+    def test_input_many(self):
+        # a batch of events is laid out as the events input one by one
+        rnd = random.Random(14)
+        keys = [rnd.choice('abcdefgh  \n\bUDLR') for n in xrange(300)]
+        one, many = _editor(''), _editor('')
+        for char in keys: one.input(_key(char))
+        many.input_many([_key(char) for char in keys[:150]])
+        many.input_many([_key(char) for char in keys[150:]])
+        self.assertTrue(_state(one) == _state(many), 'layouts differ')
+
+
+    def test_insert_text(self):
+        # lower case, so that no character types an arrow key
+        txt = TXT.lower()
+        typed, inserted = _editor(''), _editor('')
+        for char in txt: typed.input(_key(char))
+        inserted.insert_text(txt)
+        self.assertTrue(_state(typed) == _state(inserted), 'layouts differ')
+
+
+    def test_insert_text_at(self):
+        editor = _editor('the fox')
+        editor.insert_text('quick ', 4)
+        self.assertEqual(editor.get_text(), 'the quick fox')
+        self.assertEqual(editor._cursor, len('the quick fox'))
+        editor.input(_key('L'))
+        editor.insert_text('!', len('the quick fox'))
+        self.assertEqual(editor.get_text(), 'the quick fox!')
+        self.assertEqual(editor._cursor, len('the quick fo'))
+
+
+
+class HitTest(unittest.TestCase):
+
+
+    def test_widths_are_the_widths_of_prefixes(self):
+        editor = _editor()
+        size, txt, wraps = editor.font.size, editor.txt, editor._wraps
+        for l in xrange(len(wraps)):
+            if l == len(wraps) - 1: n = len(txt)
+            else: n = wraps[l + 1]
+            line_txt = txt[wraps[l]:n]
+            self.assertEqual(list(editor._get_widths(l)),
+                             [size(line_txt[:j])[0]
+                              for j in xrange(len(line_txt) + 1)])
+
+
+    def test_pixel2line(self):
+        editor = _editor()
+        lines = editor._lines
+        self.assertTrue(len(lines) > 3)
+        for y in xrange(-2, lines[-1].rect.bottom + 4):
+            expected = len(lines) - 1
+            for l, line in enumerate(lines):
+                if line.rect.y > y:
+                    expected = l - 1
+                    break
+            self.assertEqual(editor._pixel2line((0, y)), expected)
+
+
+    def test_pixel2index(self):
+        # a pixel maps to the index whose prefix ends nearest to it
+        editor = _editor()
+        wraps, txt = editor._wraps, editor.txt
+        for l, line in enumerate(editor._lines):
+            if l == len(wraps) - 1: n = len(txt)
+            else: n = wraps[l + 1]
+            widths = editor._get_widths(l)
+            for x in xrange(0, editor.rect.w, 2):
+                i = editor._pixel2index((x, line.rect.y))
+                self.assertTrue(wraps[l] <= i < max(n, wraps[l] + 1))
+                nearest = min(abs(widths[j] - x)
+                              for j in xrange(max(n - wraps[l], 1)))
+                self.assertEqual(abs(widths[i - wraps[l]] - x), nearest)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,589 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+tests of Glyph
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+from StringIO import StringIO
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+from pygame.font import Font
+from pygame.image import tostring
+
+from glyph import Glyph, LRUCache, Macros, Paginator
+from glyph import glyph as glyph_module
+from glyph.glyph import _Shape
+from glyph.glyph import (_CHARS, _CLOSE, _COMPILED, _ENV, _FUNC, _SPECIAL,
+                         _TEXT, _compile, _compile_stream, _lex)
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+RESOURCES = os.path.join(os.path.dirname(__file__), os.pardir, 'examples',
+                         'resources')
+SILKSCREEN = os.path.join(RESOURCES, 'font', 'silkscreen.ttf')
+
+
+
+def _typeset(txt, rect=(0, 0, 200, 50), justify=None, **kwargs):
+    # a glyph with txt input to it
+    glyph = Glyph(Rect(rect), **kwargs)
+    glyph.input(txt, justify)
+    return glyph
+
+
+
+def _image(glyph):
+    # the pixels of the image of a glyph, to compare images by
+    return tostring(glyph.image, 'RGB')
+
+
+
+def _links(glyph):
+    # the links of a glyph, as sorted lists of rect tuples, to compare links by
+    return dict((link, sorted(tuple(rect) for rect in rects))
+                for link, rects in glyph.links.items() if rects)
+
+
+
+class CompileTest(unittest.TestCase):
+
+
+    def tearDown(self):
+        Macros.pop('m', None)
+
+
+    def test_document_is_compiled_once(self):
+        txt = 'compiled {color 255, 0, 0; once}'
+        first = _typeset(txt)
+        hits = _COMPILED.hits
+        second = _typeset(txt)
+        self.assertEqual(_COMPILED.hits, hits + 1)
+        self.assertEqual(_image(first), _image(second))
+
+
+    def test_macro_change_compiles_again(self):
+        Macros['m'] = ('color', (255, 0, 0))
+        red = _image(_typeset('a {m; macro}'))
+        Macros['m'] = ('color', (0, 255, 0))
+        green = _image(_typeset('a {m; macro}'))
+        self.assertNotEqual(red, green)
+        self.assertEqual(green, _image(_typeset('a {color 0, 255, 0; macro}')))
+
+
+    def test_font_style_change_is_not_cached(self):
+        font = Font(None, 16)
+        _typeset('styled text', font=font)
+        font.set_bold(True)
+        self.assertEqual(_image(_typeset('styled text', font=font)),
+                         _image(_typeset('styled text', font=font, cache=None)))
+
+
+
+class LexTest(unittest.TestCase):
+
+
+    def test_lexemes(self):
+        self.assertEqual(list(_lex('a /{b {red; c}/n/img{x, 2, 3}//')),
+                         [(_TEXT, 'a '), (_SPECIAL, '{'), (_TEXT, 'b '),
+                          (_ENV, ('red', None)), (_TEXT, ' c'),
+                          (_CLOSE, None), (_SPECIAL, '\n'),
+                          (_FUNC, ('img', 'x, 2, 3')), (_SPECIAL, '/')])
+
+
+    def test_unterminated_markup(self):
+        self.assertRaises(ValueError, list, _lex('an {unterminated env'))
+        self.assertRaises(ValueError, list, _lex('an /unterminated{func'))
+
+
+    def test_markup_cut_anywhere_compiles_the_same(self):
+        # text cut between chunks is compiled to more _CHARS ops, and words
+        # cut between chunks to more words, which are joined to compare the
+        # documents
+        def join(ops):
+            document = []
+            for op, arg in ops:
+                if op != _CHARS:
+                    document.append((op, arg))
+                    continue
+                if not (document and document[-1][0] == _CHARS):
+                    document.append((_CHARS, []))
+                chars = document[-1][1]
+                for char in arg:
+                    if chars and not char.isspace() and not chars[-1].isspace():
+                        chars[-1] += char
+                    else: chars.append(char)
+            return document
+        txt = ('  a {color 1, 2, 3; colored /{ word}/n/nand  a'
+               ' {link x; /img{x.png}link}  ')
+        document = join(_compile(txt))
+        for i in xrange(len(txt) + 1):
+            chunks = [txt[:i], txt[i:]]
+            self.assertEqual(join(op for ops in _compile_stream(chunks)
+                                  for op in ops), document)
+
+
+
+class TokenCacheTest(unittest.TestCase):
+
+
+    def test_tokens_are_shared_between_glyphs(self):
+        cache = LRUCache()
+        txt = 'shared words, {color 0, 0, 255; shared} again'
+        first = _typeset(txt, cache=cache)
+        misses = cache.misses
+        second = _typeset(txt, cache=cache)
+        self.assertEqual(cache.misses, misses)
+        self.assertTrue(cache.hits)
+        self.assertEqual(_image(first), _image(second))
+        self.assertEqual(_image(second), _image(_typeset(txt, cache=None)))
+
+
+    def test_tokens_keep_their_links(self):
+        # a cached word is linked by the link it is input under
+        cache = LRUCache()
+        glyph = _typeset('{link a; word} {link b; word}', cache=cache)
+        a, b = glyph.links['a'], glyph.links['b']
+        self.assertEqual(len(a), 1)
+        self.assertEqual(len(b), 1)
+        self.assertEqual(a[0].size, b[0].size)
+        self.assertEqual(glyph.get_collisions(a[0].center), 'a')
+        self.assertEqual(glyph.get_collisions(b[0].center), 'b')
+
+
+
+class CollisionTest(unittest.TestCase):
+
+
+    def check(self, glyph):
+        # points of the image, on a grid and on the corners of link rects,
+        # collide with the link whose rects hold them, as found by walking
+        # every link rect
+        rects = [(rect, link) for link, _rects in glyph.links.items()
+                 if link is not None for rect in _rects]
+        points = [(px, py) for py in xrange(0, glyph.rect.h, 3)
+                  for px in xrange(0, glyph.rect.w, 3)]
+        for rect, link in rects:
+            points.extend([rect.topleft, (rect.right - 1, rect.bottom - 1),
+                           (rect.right, rect.y), (rect.x, rect.bottom)])
+        x, y = glyph.rect.topleft
+        for px, py in points:
+            links = set(link for rect, link in rects
+                        if rect.collidepoint(px, py))
+            link = glyph.get_collisions((x + px, y + py))
+            if links: self.assertTrue(link in links)
+            else: self.assertEqual(link, None)
+
+
+    def test_collisions(self):
+        txt = ' '.join('{link %d; linked %s} plain' % (i, 'word ' * (i % 4))
+                       for i in xrange(30))
+        self.check(_typeset(txt, (10, 20, 300, 200), ncols=2))
+        self.check(_typeset(txt, (0, 0, 300, 200), 'justified'))
+
+
+
+class RelayoutTest(unittest.TestCase):
+    # paragraphs changed in place draw what the glyph draws for the changed
+    # text input at once
+
+
+    def setUp(self):
+        Macros['big'] = ('font', Font(None, 24))
+
+
+    def tearDown(self):
+        del Macros['big']
+
+
+    def typeset(self, paras, justify=None):
+        return _typeset(''.join(para + '/n' for para in paras),
+                        (0, 0, 200, 100), justify)
+
+
+    def check(self, glyph, paras, justify=None):
+        expected = self.typeset(paras, justify)
+        self.assertTrue(_image(glyph) == _image(expected), 'images differ')
+        self.assertEqual(_links(glyph), _links(expected))
+
+
+    def test_insert(self):
+        paras = ['the first', '{link a; the second}', 'the third']
+        glyph = self.typeset(paras)
+        glyph.insert(1, 'a {big; new} one/n')
+        paras[1:1] = ['a {big; new} one']
+        self.check(glyph, paras)
+        glyph.insert(4, 'the {link b; end}/n')
+        self.check(glyph, paras + ['the {link b; end}'])
+
+
+    def test_insert_keeps_justify(self):
+        for justify in ('center', 'right'):
+            glyph = self.typeset(['the first', 'the second'], justify)
+            glyph.insert(1, 'inserted/n')
+            glyph.insert(3, 'appended/n')
+            self.check(glyph, ['the first', 'inserted', 'the second',
+                               'appended'], justify)
+
+
+    def test_replace(self):
+        paras = ['the first', '{link a; the second}', 'the third']
+        glyph = self.typeset(paras)
+        glyph.replace(1, '{link b; the same height}/n')
+        paras[1] = '{link b; the same height}'
+        self.check(glyph, paras)
+        glyph.replace(0, 'a {big; higher} line/n')
+        paras[0] = 'a {big; higher} line'
+        self.check(glyph, paras)
+
+
+    def test_replace_span(self):
+        glyph = self.typeset(['the first', 'the {color 255, 0, 0; red} word'])
+        glyph.replace_span(1, 5, 6, 'ai')
+        self.check(glyph, ['the first', 'the {color 255, 0, 0; raid} word'])
+
+
+
+class ScrollTest(unittest.TestCase):
+    # a scrolled glyph shows the part of the document a glyph high enough for
+    # the whole document shows at the y scrolled to
+
+
+    def setUp(self):
+        Macros['big'] = ('font', Font(SILKSCREEN, 16))
+        Macros['red'] = ('color', (255, 0, 0))
+        self.font = Font(SILKSCREEN, 8)
+
+
+    def tearDown(self):
+        del Macros['big'], Macros['red']
+
+
+    def scrolled(self, txt):
+        # a glyph with txt input to it, scrolled to the top of the document
+        glyph = Glyph(Rect(0, 0, 200, 100), font=self.font)
+        glyph.input(txt, update=False)
+        glyph.scroll_to(0)
+        return glyph
+
+
+    def check(self, glyph, txt):
+        w, h = glyph.rect.size
+        whole = _typeset(txt, (0, 0, w, 1000), font=self.font)
+        view = whole.image.subsurface((0, glyph.scroll_y, w, h))
+        self.assertTrue(_image(glyph) == tostring(view, 'RGB'),
+                        'images differ at %d' % glyph.scroll_y)
+
+
+    def test_scroll(self):
+        txt = ' '.join('line {big; %d} of the {red; document}/n' % i
+                       for i in xrange(40))
+        glyph = self.scrolled(txt)
+        for y in (0, 5, 40, 41, 300, 290, 150, 0, 10000):
+            glyph.scroll_to(y)
+            self.check(glyph, txt)
+        for dy in (-3, -50, 7, 200):
+            glyph.scroll_by(dy)
+            self.check(glyph, txt)
+
+
+    def test_replace_after_scroll(self):
+        paras = (['{red; text} with the', 'the jumps {big; text} text fox']
+                 + ['lazy the'] * 20)
+        glyph = self.scrolled('/n'.join(paras))
+        glyph.scroll_to(5)
+        glyph.replace(0, 'quick dog renders/n')
+        paras[0] = 'quick dog renders'
+        self.check(glyph, '/n'.join(paras))
+
+
+
+class StreamTest(unittest.TestCase):
+    # streamed input draws what the whole text input at once draws
+
+
+    def setUp(self):
+        pot = pygame.Surface((6, 9))
+        pot.fill((200, 20, 20))
+        Macros['pot'] = pot
+        Macros['red'] = ('color', (255, 0, 0))
+        self.font = Font(SILKSCREEN, 8)
+
+
+    def tearDown(self):
+        del Macros['pot'], Macros['red']
+
+
+    def check(self, source, txt):
+        streamed = _typeset(source, (0, 0, 200, 100), font=self.font)
+        whole = _typeset(txt, (0, 0, 200, 100), font=self.font)
+        self.assertTrue(_image(streamed) == _image(whole), 'images differ')
+        self.assertEqual(_links(streamed), _links(whole))
+
+
+    def test_markup_cut_anywhere(self):
+        txt = ('a {red; colored /{ word} and/n/n{link a; a /pot{}'
+               ' link}  in  a {red; {link b; nested/nlink}}')
+        for i in xrange(len(txt) + 1):
+            self.check(iter([txt[:i], txt[i:]]), txt)
+        rnd = random.Random(23)
+        for n in xrange(20):
+            cuts = sorted(rnd.sample(xrange(len(txt) + 1), 6))
+            self.check((txt[i:j] for i, j in zip([0] + cuts, cuts + [None])),
+                       txt)
+        self.check(StringIO(txt), txt)
+
+
+    def test_stream_is_read_as_it_is_scrolled(self):
+        txt = ''.join('line {red; %d} of the document/n' % i
+                      for i in xrange(100))
+        chunks = txt.split('/n')
+        read = []
+        def source():
+            for chunk in chunks[:-1]:
+                read.append(chunk)
+                yield chunk + '/n'
+        glyph = Glyph(Rect(0, 0, 200, 100), font=self.font)
+        glyph.input(source(), update=False)
+        glyph.scroll_to(0)
+        self.assertTrue(len(read) < 20)
+        whole = _typeset(txt, (0, 0, 200, 2000), font=self.font)
+        for y in (0, 40, 300):
+            glyph.scroll_to(y)
+            self.assertTrue(len(read) < 60)
+            view = whole.image.subsurface((0, y, 200, 100))
+            self.assertTrue(_image(glyph) == tostring(view, 'RGB'),
+                            'images differ at %d' % y)
+        glyph.scroll_to(10 ** 6)
+        self.assertEqual(len(read), 100)
+        self.assertEqual(glyph.get_document_height(),
+                         whole.measure(txt)[0][1])
+
+
+
+class JustifyTest(unittest.TestCase):
+    # stretched whitespace filled with its background draws what the
+    # whitespace rendered and scaled draws
+
+
+    def setUp(self):
+        self.get_fill = _Shape.get_fill
+        underlined = Font(None, 16)
+        underlined.set_underline(True)
+        Macros['u'] = ('font', underlined)
+        Macros['hl'] = ('bkg', (0, 0, 120))
+
+
+    def tearDown(self):
+        _Shape.get_fill = self.get_fill
+        del Macros['u'], Macros['hl']
+
+
+    def test_fill(self):
+        txt = ('the {u; underlined words} and {hl; highlighted words} of a'
+               ' justified {link a; paragraph} of text, wrapped to lines of'
+               ' text/nthe end')
+        for runs in (False, True):
+            filled = _typeset(txt, justify='justified', runs=runs, cache=None)
+            _Shape.get_fill = lambda shape: None
+            scaled = _typeset(txt, justify='justified', runs=runs, cache=None)
+            _Shape.get_fill = self.get_fill
+            self.assertTrue(_image(filled) == _image(scaled), 'images differ')
+            self.assertEqual(_links(filled), _links(scaled))
+
+
+
+class RunsTest(unittest.TestCase):
+    # lines rendered as runs of text draw what lines rendered a word at a
+    # time draw
+
+
+    def setUp(self):
+        pot = pygame.Surface((6, 9))
+        pot.fill((200, 20, 20))
+        Macros['pot'] = pot
+        Macros['big'] = ('font', Font(SILKSCREEN, 16))
+        Macros['red'] = ('color', (255, 0, 0))
+        Macros['hl'] = ('bkg', (0, 0, 120))
+
+
+    def tearDown(self):
+        del Macros['pot'], Macros['big'], Macros['red'], Macros['hl']
+
+
+    def test_runs(self):
+        txt = ('AVATAR To. the {red; quick /pot{} brown} fox {big; jumps}'
+               ' over the {hl; lazy dog} and {link a; links the  words}'
+               ' of a paragraph wrapped to /space{7} lines/n/nWAVE {hl; Fy,}'
+               ' glyphs')
+        font = Font(SILKSCREEN, 8)
+        for justify in (None, 'right', 'center', 'justified'):
+            for kwargs in ({}, {'font': font}, {'ncols': 2}):
+                words = _typeset(txt, (0, 0, 300, 120), justify, **kwargs)
+                runs = _typeset(txt, (0, 0, 300, 120), justify, runs=True,
+                                **kwargs)
+                self.assertTrue(_image(words) == _image(runs),
+                                'images differ for %s, %s' % (justify, kwargs))
+                self.assertEqual(_links(words), _links(runs))
+
+
+
+class AtlasTest(unittest.TestCase):
+    # text drawn from glyph atlases draws what rendered text draws
+
+
+    def setUp(self):
+        Macros['hl'] = ('bkg', (0, 0, 120))
+        Macros['red'] = ('color', (255, 0, 0))
+
+
+    def tearDown(self):
+        del Macros['hl'], Macros['red']
+
+
+    def test_atlas(self):
+        # characters of the default font are rendered to differing heights,
+        # so the cells of an atlas do not all cover the text they draw
+        txts = ['a {hl; glyph dog} b',
+                'AVATAR {hl; quick {red; Fy, jig} and} over the {hl; lazy}'
+                ' dog/n{hl; aaa ggg} {red; ...}']
+        fonts = [Font(None, 20), Font(SILKSCREEN, 8)]
+        for txt in txts:
+            for font in fonts:
+                for runs in (False, True):
+                    kwargs = dict(font=font, cache=None, runs=runs)
+                    rendered = _typeset(txt, (0, 0, 200, 80), **kwargs)
+                    drawn = _typeset(txt, (0, 0, 200, 80), atlas=True,
+                                     **kwargs)
+                    self.assertTrue(_image(rendered) == _image(drawn),
+                                    'images differ for %r, %s, %s'
+                                    % (txt, font.get_height(), runs))
+
+
+    def test_atlas_without_blits(self):
+        # pygame before 1.9.4 has no Surface.blits, and cells are copied one
+        # by one
+        blits = glyph_module._BLITS
+        glyph_module._BLITS = False
+        try: self.test_atlas()
+        finally: glyph_module._BLITS = blits
+
+
+
+class AsyncTest(unittest.TestCase):
+    # text input with input_async draws what text input with input draws
+
+
+    def setUp(self):
+        Macros['red'] = ('color', (255, 0, 0))
+
+
+    def tearDown(self):
+        del Macros['red']
+
+
+    def check(self, glyph, expected):
+        self.assertTrue(_image(glyph) == _image(expected), 'images differ')
+        self.assertEqual(_links(glyph), _links(expected))
+        self.assertEqual(sorted(glyph.editors), sorted(expected.editors))
+
+
+    def test_input_async(self):
+        txt = 'some {red; async} text and {link a; a link}/nand a second line'
+        glyph = Glyph(Rect(0, 0, 200, 50))
+        glyph.input_async(txt).get()
+        glyph.update()
+        self.check(glyph, _typeset(txt))
+
+
+    def test_order(self):
+        # text is added in the order it is input, and each input continues
+        # the environments left open by the input before it
+        txts = ['the first {red; paragraph/n', 'the second/n',
+                'an {editor e, 40; editor}}/n', 'and {link a; the last}']
+        glyph = Glyph(Rect(0, 0, 200, 80))
+        results = [glyph.input_async(txt) for txt in txts[:-1]]
+        glyph.input(txts[-1])
+        self.assertTrue(all(result.ready() for result in results))
+        expected = Glyph(Rect(0, 0, 200, 80))
+        for txt in txts: expected.input(txt)
+        self.check(glyph, expected)
+
+
+    def test_failed_layout(self):
+        glyph = Glyph(Rect(0, 0, 200, 50))
+        result = glyph.input_async('an {unterminated env')
+        result.wait()
+        self.assertRaises(ValueError, glyph.update)
+        self.assertRaises(ValueError, result.get)
+        # the failed layout is dropped
+        glyph.input('more text')
+        self.check(glyph, _typeset('more text'))
+
+
+
+class MeasureTest(unittest.TestCase):
+
+
+    def test_measure_keeps_environments(self):
+        # an environment left open by measured text is not left open on the
+        # glyph
+        glyph = Glyph(Rect(0, 0, 200, 50))
+        envs = list(glyph._envs)
+        (w, h), n = glyph.measure('hello {color 255, 0, 0; world')
+        self.assertTrue(w > 0 and h > 0)
+        self.assertEqual(n, 1)
+        self.assertEqual(glyph._envs, envs)
+
+        glyph.input('hello world')
+        fresh = Glyph(Rect(0, 0, 200, 50))
+        fresh.input('hello world')
+        self.assertEqual(tostring(glyph.image, 'RGB'),
+                         tostring(fresh.image, 'RGB'))
+
+
+
+class PaginatorTest(unittest.TestCase):
+
+
+    def test_redrawn_page_keeps_links_of_held_page(self):
+        # a page dropped from the kept pages and drawn again while it is still
+        # held draws the same page, and leaves the links of the held page as
+        # they were
+        txt = '/n'.join('{link %d; linked line %d} of text' % (i, i)
+                        for i in xrange(12))
+        pages = Paginator(txt, Rect(0, 0, 200, 40), keep=1)
+        first = pages[0]
+        links = _links(first)
+        self.assertTrue(links)
+        pages[1]
+        again = pages[0]
+        self.assertTrue(again is not first)
+        self.assertEqual(_links(first), links)
+        self.assertEqual(_links(again), links)
+        self.assertTrue(_image(again) == _image(first), 'images differ')
+        for link, rects in links.items():
+            for rect in rects:
+                self.assertTrue(first.image.get_rect().contains(rect))
+                x, y = Rect(rect).center
+                self.assertEqual(first.get_collisions((x, y)), link)
+                self.assertEqual(again.get_collisions((x, y)), link)
+        # the links of a page are its own
+        self.assertFalse(set(map(id, first.links['0']))
+                         & set(map(id, again.links['0'])))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2011, Chandler Armstrong (omni dot armstrong at gmail dot com)
+# see LICENSE.txt for details
+
+"""
+tests of PageCache
+
+usage: python -m unittest discover tests
+"""
+
+import cPickle as pickle
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pygame
+from pygame import Rect
+from pygame.image import tostring
+
+from glyph import Glyph, Macros, PageCache, Stats
+from glyph import pages
+
+pygame.display.init()
+pygame.display.set_mode((1, 1), 0, 32)
+
+
+
+TXT = ('a {red; red} word, a {link a; link}/nand an {editor name, 60; '
+       'editor} on a second line')
+RECT = Rect(0, 0, 200, 60)
+
+
+
+class _Unpickled(object):
+    # an object that records that it was unpickled
+    unpickled = False
+
+
+    def __reduce__(self):
+        return (_unpickle, ())
+
+
+
+def _unpickle():
+    _Unpickled.unpickled = True
+    return _Unpickled()
+
+
+
+class PageCacheTest(unittest.TestCase):
+
+
+    def setUp(self):
+        Macros['red'] = ('color', (255, 0, 0))
+        self.path = tempfile.mkdtemp()
+        self.cache = PageCache(self.path)
+
+
+    def tearDown(self):
+        del Macros['red']
+        shutil.rmtree(self.path)
+
+
+    def test_loaded_page_is_drawn_as_input(self):
+        expected = Glyph(Rect(RECT))
+        expected.input(TXT)
+        rendered = self.cache.load(TXT, RECT)
+        loaded = self.cache.load(TXT, RECT)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        for glyph in (rendered, loaded):
+            self.assertTrue(tostring(glyph.image, 'RGB')
+                            == tostring(expected.image, 'RGB'),
+                            'images differ')
+            self.assertEqual(
+                dict((k, [tuple(r) for r in v])
+                     for k, v in glyph.links.items() if v),
+                dict((k, [tuple(r) for r in v])
+                     for k, v in expected.links.items() if v))
+            self.assertEqual(sorted(glyph.editors), ['name'])
+            self.assertEqual(glyph.editors['name'].get_text(), 'editor')
+        x, y = expected.links['a'][0].center
+        self.assertEqual(loaded.get_collisions((x, y)), 'a')
+        self.assertTrue(loaded.get_dirty())
+
+
+    def test_key(self):
+        # the cache and instrument arguments do not change the page
+        key = self.cache.key(TXT, RECT)
+        self.assertEqual(self.cache.key(TXT, RECT, cache=None), key)
+        self.assertEqual(self.cache.key(TXT, RECT, instrument=Stats()), key)
+        self.assertEqual(self.cache.key(TXT, RECT, instrument=True), key)
+        self.assertNotEqual(self.cache.key(TXT, RECT, runs=True), key)
+        self.assertNotEqual(self.cache.key(TXT, Rect(0, 0, 200, 61)), key)
+        # values whose repr differs between processes can not be keyed
+        self.assertRaises(TypeError, self.cache.key, TXT, RECT,
+                          bkg=object())
+
+
+    def test_page_files_are_not_unpickled(self):
+        path = os.path.join(self.path, self.cache.key(TXT, RECT) + '.page')
+        page = pickle.dumps(_Unpickled())
+        with open(path, 'wb') as f:
+            f.write(pages.HEADER.pack(pages.MAGIC, 1, 1, len(page)))
+            f.write('\0' * 4)
+            f.write(page)
+        self.assertRaises(ValueError, self.cache.load, TXT, RECT)
+        self.assertFalse(_Unpickled.unpickled)
+
+
+    def test_loaded_glyph_lays_out_no_text(self):
+        self.cache.load(TXT, RECT)
+        glyph = self.cache.load(TXT, RECT)
+        self.assertRaises(ValueError, glyph.input, 'more')
+        self.assertRaises(ValueError, glyph.input_async, 'more')
+        self.assertRaises(ValueError, glyph.insert, 0, 'more')
+        self.assertRaises(ValueError, glyph.replace, 0, 'more')
+        self.assertRaises(ValueError, glyph.replace_span, 0, 0, 1, 'more')
+        self.assertRaises(ValueError, glyph.scroll_to, 10)
+        # a cleared glyph lays out text
+        glyph.clear()
+        glyph.input(TXT)
+        expected = Glyph(Rect(RECT))
+        expected.input(TXT)
+        self.assertTrue(tostring(glyph.image, 'RGB')
+                        == tostring(expected.image, 'RGB'), 'images differ')
+
+
+
+if __name__ == '__main__':
+    unittest.main()